@@ -1,4 +1,4 @@
 # __init__.py
 from .gmail_functions import GmailPriorityManager
 from .response_suggester import ResponseSuggester
-
+from .multi_account import MultiAccountManager
@@ -0,0 +1,282 @@
+import os
+import re
+import sys
+import json
+import time
+import base64
+import logging
+import argparse
+from email import policy
+from email.parser import BytesHeaderParser, BytesParser
+from email.utils import parsedate_to_datetime
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from .gmail_functions import GmailPriorityManager
+from .behavior_store import BehaviorStore
+from .mime_walker import extract_body, MAX_BODY_BYTES
+
+_HEADER_PARSER = BytesHeaderParser(policy=policy.compat32)
+_MESSAGE_PARSER = BytesParser(policy=policy.default)
+# mboxrd quotes body lines matching ">*From " with one more ">" when writing the file
+_MBOX_FROM_QUOTED = re.compile(rb'^>(>*From )', re.MULTILINE)
+# Worker-process manager, created by _init_worker
+_manager = None
+# Threads handed to a worker at once; their key points are extracted in one spaCy batch
+THREADS_PER_TASK = 16
+
+
+def iter_locations(paths):
+    """Yield (path, start, end) byte ranges of every message in mbox files, .eml files and directories."""
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                for name in sorted(files):
+                    if name.lower().endswith('.eml'):
+                        yield os.path.join(root, name), 0, None
+        elif path.lower().endswith('.eml'):
+            yield path, 0, None
+        else:
+            yield from _iter_mbox(path)
+
+
+def _iter_mbox(path):
+    """Yield the byte range of each message in an mbox file, streaming it line by line."""
+    start = None
+    offset = 0
+    previous_blank = True
+    with open(path, 'rb') as mbox:
+        for line in mbox:
+            if line.startswith(b'From ') and previous_blank:
+                if start is not None:
+                    yield path, start, offset
+                # The message starts after the "From " envelope line
+                start = offset + len(line)
+            previous_blank = line in (b'\n', b'\r\n')
+            offset += len(line)
+    if start is not None:
+        yield path, start, offset
+
+
+def read_message(location, header_only=False):
+    """Read the raw bytes (or only the header block) of a message location."""
+    path, start, end = location
+    with open(path, 'rb') as source:
+        source.seek(start)
+        if not header_only:
+            if end is None:
+                return source.read()
+            # Undo the mbox "From " quoting so bodies read as they were sent
+            return _MBOX_FROM_QUOTED.sub(rb'\1', source.read(end - start))
+        lines = []
+        position = start
+        for line in source:
+            if line in (b'\n', b'\r\n') or (end is not None and position >= end):
+                break
+            lines.append(line)
+            position += len(line)
+        return b''.join(lines)
+
+
+def _message_ids(value):
+    return [part.strip() for part in (value or '').replace('><', '> <').split() if part.strip()]
+
+
+class _ThreadIndex:
+    """Union-find over Message-ID/In-Reply-To/References."""
+
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, message_id):
+        root = self.parent.setdefault(message_id, message_id)
+        while root != self.parent[root]:
+            root = self.parent[root]
+        while message_id != root:
+            self.parent[message_id], message_id = root, self.parent[message_id]
+        return root
+
+    def union(self, first, second):
+        first_root, second_root = self.find(first), self.find(second)
+        if first_root != second_root:
+            self.parent[second_root] = first_root
+
+
+def group_threads(locations):
+    """Group message locations into threads using only their headers.
+
+    Returns a list of threads, each a list of (message_id, location, timestamp)
+    tuples ordered oldest first.
+    """
+    index = _ThreadIndex()
+    messages = []
+    for location in locations:
+        try:
+            headers = _HEADER_PARSER.parsebytes(read_message(location, header_only=True))
+        except Exception as e:
+            logging.error(f"Error reading headers of {location[0]}@{location[1]}: {str(e)}")
+            continue
+        message_id = (headers.get('Message-ID') or '').strip() or f"<{location[0]}:{location[1]}>"
+        try:
+            timestamp = parsedate_to_datetime(headers.get('Date')).timestamp()
+        except (TypeError, ValueError):
+            timestamp = 0.0
+        index.find(message_id)
+        for reference in _message_ids(headers.get('References')) + _message_ids(headers.get('In-Reply-To')):
+            index.union(reference, message_id)
+        messages.append((message_id, location, timestamp))
+
+    threads = {}
+    for message in messages:
+        threads.setdefault(index.find(message[0]), []).append(message)
+    return [sorted(thread, key=lambda message: message[2]) for thread in threads.values()]
+
+
+def to_gmail_payload(part, max_body_bytes=MAX_BODY_BYTES):
+    """Convert a parsed email part into the shape of a Gmail API payload."""
+    payload = {
+        'mimeType': part.get_content_type(),
+        'filename': part.get_filename() or '',
+        'headers': [{'name': name, 'value': str(value)} for name, value in part.items()],
+        'body': {'size': 0}
+    }
+    if part.is_multipart():
+        payload['parts'] = [to_gmail_payload(child, max_body_bytes) for child in part.iter_parts()]
+    else:
+        raw = part.get_payload(decode=True) or b''
+        payload['body']['size'] = len(raw)
+        # Only text bodies are kept, cut to the size the models would see anyway
+        if payload['mimeType'].startswith('text/') and not payload['filename']:
+            payload['body']['data'] = base64.urlsafe_b64encode(raw[:max_body_bytes]).decode()
+    return payload
+
+
+def _to_gmail_message(message_id, thread_id, raw, timestamp):
+    payload = to_gmail_payload(_MESSAGE_PARSER.parsebytes(raw))
+    return {
+        'id': message_id,
+        'threadId': thread_id,
+        'internalDate': str(int(timestamp * 1000)),
+        'labelIds': [],
+        'snippet': extract_body(payload, 1000)[:200],
+        'payload': payload
+    }
+
+
+def _init_worker(behavior_file):
+    global _manager
+    logging.getLogger().setLevel(logging.WARNING)
+    _manager = GmailPriorityManager(behavior_file=behavior_file, mirror_path=None,
+                                    max_workers=1, reply_index_dir=None, behavior_log_dir=None,
+                                    connect=False)
+
+
+def triage_thread(thread):
+    """Score and summarize one thread in a worker process. Returns NDJSON-ready records."""
+    return triage_threads([thread])
+
+
+def triage_threads(threads):
+    """Score and summarize threads in a worker process, extracting their key points in one batch."""
+    gmail_threads = []
+    for thread in threads:
+        thread_id = thread[0][0]
+        messages = []
+        for message_id, location, timestamp in thread:
+            try:
+                messages.append(_to_gmail_message(message_id, thread_id, read_message(location), timestamp))
+            except Exception as e:
+                logging.error(f"Error parsing {location[0]}@{location[1]}: {str(e)}")
+        gmail_threads.append({'id': thread_id, 'messages': messages})
+
+    prepared = _manager.prepare_threads(gmail_threads)
+    records = []
+    for gmail_thread in gmail_threads:
+        records.extend(_thread_records(gmail_thread))
+    _manager.discard_prepared_threads(prepared)
+    _manager.analysis_cache.clear()
+    return records
+
+
+def _thread_records(gmail_thread):
+    thread_id, messages = gmail_thread['id'], gmail_thread['messages']
+    records = []
+    for message in messages:
+        result = _manager.process_new_email(message['id'], message=message, thread=gmail_thread)
+        email_data = result['email_data']
+        summary = result['thread_summary']
+        suggestions = _manager.response_suggester.get_suggestions(email_data.get('content', ''), email_data)
+        records.append({
+            'message_id': message['id'],
+            'thread_id': thread_id,
+            'subject': email_data.get('subject', ''),
+            'sender': email_data.get('sender', ''),
+            'priority': result['priority'],
+            'prefilter_reason': email_data.get('prefilter_reason'),
+            'summary': summary.get('summary', ''),
+            'key_points': summary.get('key_points', []),
+            'thread_message_count': len(messages),
+            'suggestions': [suggestion['type'] for suggestion in suggestions]
+        })
+    return records
+
+
+def triage_archives(paths, output_path, workers=None, behavior_file="user_behavior.json",
+                    report_every=1000):
+    """Triage every message of the given archives into an NDJSON file. Returns (messages, seconds)."""
+    started = time.monotonic()
+    threads = group_threads(iter_locations(paths))
+    logging.info(f"Found {sum(len(thread) for thread in threads)} messages in {len(threads)} threads "
+                 f"in {time.monotonic() - started:.1f}s.")
+
+    # Migrate the behavior file once here rather than racing in every worker
+    BehaviorStore(behavior_file).close()
+
+    workers = workers or os.cpu_count() or 1
+    done = 0
+    next_report = report_every
+    with open(output_path, 'w') as output, ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker, initargs=(behavior_file,)) as executor:
+        pending = set()
+        remaining = (threads[start:start + THREADS_PER_TASK] for start in range(0, len(threads), THREADS_PER_TASK))
+        while True:
+            # Keep a bounded number of thread groups in flight
+            for group in remaining:
+                pending.add(executor.submit(triage_threads, group))
+                if len(pending) >= workers * 4:
+                    break
+            if not pending:
+                break
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                try:
+                    records = future.result()
+                except Exception as e:
+                    logging.error(f"Error triaging threads: {str(e)}")
+                    continue
+                for record in records:
+                    output.write(json.dumps(record) + "\n")
+                done += len(records)
+            if done >= next_report:
+                elapsed = time.monotonic() - started
+                logging.info(f"{done} messages, {done / elapsed:.1f} msgs/sec")
+                next_report = done + report_every
+
+    return done, time.monotonic() - started
+
+
+def main(argv=None):
+    """Command line entry point: python -m gmail_module.archive_triage archive.mbox eml_dir/ -o out.ndjson"""
+    parser = argparse.ArgumentParser(description="Triage mbox files and .eml directories offline.")
+    parser.add_argument("paths", nargs="+", help="mbox files, .eml files or directories of .eml files")
+    parser.add_argument("-o", "--output", default="triage_results.ndjson", help="NDJSON output file")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--behavior-file", default="user_behavior.json", help="sender history used for scoring")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    count, seconds = triage_archives(args.paths, args.output, args.workers, args.behavior_file)
+    print(f"Triaged {count} messages in {seconds:.1f}s ({count / seconds if seconds else 0:.1f} msgs/sec) "
+          f"-> {args.output}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+import os
+import base64
+import hashlib
+import logging
+import tempfile
+from .mime_walker import iter_parts, is_attachment
+
+# Parts larger than this are not downloaded unless truncation is requested
+MAX_ATTACHMENT_BYTES = 25 * 1024 * 1024
+# base64 characters decoded per step (a multiple of 4, ~768KB decoded)
+DECODE_CHUNK_CHARS = 1024 * 1024
+
+
+def attachment_fields(depth=5):
+    """Fields mask for messages.get that returns the MIME tree without any body data."""
+    part = "partId,filename,mimeType,headers,body(size,attachmentId)"
+    fields = part
+    for _ in range(depth - 1):
+        fields = f"{part},parts({fields})"
+    return f"id,threadId,payload({fields})"
+
+
+def attachment_metadata(payload):
+    """Return metadata of every attachment in a payload without touching body data."""
+    attachments = []
+    for part in iter_parts(payload):
+        if not is_attachment(part):
+            continue
+        body = part.get('body', {})
+        attachments.append({
+            'part_id': part.get('partId'),
+            'filename': part.get('filename', ''),
+            'mime_type': part.get('mimeType', ''),
+            'size': body.get('size', 0),
+            'attachment_id': body.get('attachmentId')
+        })
+    return attachments
+
+
+def drop_attachment_data(payload):
+    """Remove inline attachment data from a payload so it is not kept in memory."""
+    for part in iter_parts(payload):
+        if is_attachment(part):
+            part.get('body', {}).pop('data', None)
+    return payload
+
+
+class AttachmentStore:
+    """Content-addressed on-disk cache of decoded attachments.
+
+    Attachments are decoded from base64url in fixed-size chunks and streamed to
+    a temporary file while hashing, then moved to `<cache_dir>/<sha[:2]>/<sha>`,
+    so identical files are stored once and the decoded bytes never sit in
+    memory as a whole. A small ref file per (message, part) remembers which
+    blob belongs to which attachment.
+    """
+
+    def __init__(self, cache_dir="attachment_cache", max_bytes=MAX_ATTACHMENT_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def blob_path(self, sha256):
+        return os.path.join(self.cache_dir, sha256[:2], sha256)
+
+    def _ref_path(self, message_id, part_id):
+        return os.path.join(self.cache_dir, "refs", f"{message_id}_{part_id}")
+
+    def lookup(self, message_id, part_id):
+        """Return the cached file record of an attachment, or None."""
+        try:
+            with open(self._ref_path(message_id, part_id)) as ref:
+                sha256, size, truncated = ref.read().split()
+        except (OSError, ValueError):
+            return None
+        path = self.blob_path(sha256)
+        if not os.path.exists(path):
+            return None
+        return {'path': path, 'sha256': sha256, 'size': int(size), 'truncated': truncated == '1'}
+
+    def save(self, message_id, part_id, data, max_bytes=None):
+        """Decode base64url data in chunks to the cache and return its file record."""
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        digest = hashlib.sha256()
+        written = 0
+        truncated = False
+        os.makedirs(os.path.join(self.cache_dir, "refs"), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                for start in range(0, len(data), DECODE_CHUNK_CHARS):
+                    chunk = data[start:start + DECODE_CHUNK_CHARS]
+                    decoded = base64.urlsafe_b64decode(chunk + '=' * (-len(chunk) % 4))
+                    if written + len(decoded) > max_bytes:
+                        decoded = decoded[:max_bytes - written]
+                        truncated = True
+                    digest.update(decoded)
+                    out.write(decoded)
+                    written += len(decoded)
+                    if truncated:
+                        break
+
+            sha256 = digest.hexdigest()
+            path = self.blob_path(sha256)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if os.path.exists(path):
+                os.remove(tmp_path)
+            else:
+                os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        with open(self._ref_path(message_id, part_id), "w") as ref:
+            ref.write(f"{sha256} {written} {int(truncated)}")
+        if truncated:
+            logging.warning(f"Attachment {part_id} of {message_id} truncated to {max_bytes} bytes.")
+        return {'path': path, 'sha256': sha256, 'size': written, 'truncated': truncated}
@@ -0,0 +1,121 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from googleapiclient.errors import HttpError
+
+# Gmail accepts up to 100 calls per batch but starts rate limiting large
+# batches, so stay at the documented recommendation of 50.
+MAX_BATCH_SIZE = 50
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class GmailBatchFetcher:
+    """Fetch many Gmail messages or threads through the batch HTTP endpoint.
+
+    `service` is either a Gmail service or a zero-argument callable returning
+    the calling thread's service; with a callable and max_workers > 1 the
+    batches run concurrently, each thread on its own connection. Passing a
+    long-lived `executor` keeps those threads, and so their connections,
+    alive between fetches.
+    """
+
+    def __init__(self, service, batch_size=MAX_BATCH_SIZE, max_retries=3, backoff_seconds=1.0,
+                 max_workers=1, executor=None):
+        self._service = service
+        self.max_workers = max_workers if callable(service) else 1
+        self.executor = executor
+        self.batch_size = max(1, min(batch_size, 100))
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.failures = {}
+
+    @property
+    def service(self):
+        return self._service() if callable(self._service) else self._service
+
+    def get_messages(self, message_ids, **params):
+        """Fetch messages by id. Returns a dict of id -> message."""
+        return self._fetch('messages', message_ids, params)
+
+    def get_threads(self, thread_ids, **params):
+        """Fetch threads by id. Returns a dict of id -> thread."""
+        return self._fetch('threads', thread_ids, params)
+
+    def _fetch(self, kind, item_ids, params):
+        """Run `get` for every id in capped batches, retrying transient failures."""
+        results = {}
+        pending = [item_id for item_id in dict.fromkeys(item_ids) if item_id]
+        attempt = 0
+
+        while pending:
+            chunks = [pending[start:start + self.batch_size]
+                      for start in range(0, len(pending), self.batch_size)]
+            if self.max_workers > 1 and len(chunks) > 1:
+                fetch_chunk = lambda chunk: self._execute_batch(kind, chunk, params)
+                if self.executor is not None:
+                    outcomes = list(self.executor.map(fetch_chunk, chunks))
+                else:
+                    with ThreadPoolExecutor(max_workers=min(self.max_workers, len(chunks))) as executor:
+                        outcomes = list(executor.map(fetch_chunk, chunks))
+            else:
+                outcomes = [self._execute_batch(kind, chunk, params) for chunk in chunks]
+
+            # Each batch reports its own outcome; they are merged here on the calling thread
+            retry = []
+            for chunk_results, chunk_failures, chunk_retry in outcomes:
+                results.update(chunk_results)
+                for item_id in chunk_results:
+                    self.failures.pop(item_id, None)
+                self.failures.update(chunk_failures)
+                retry.extend(chunk_retry)
+
+            if not retry:
+                break
+            if attempt >= self.max_retries:
+                for item_id in retry:
+                    self.failures.setdefault(item_id, "retries exhausted")
+                logging.error(f"Batch fetch gave up on {len(retry)} item(s) after {attempt} retries")
+                break
+
+            attempt += 1
+            time.sleep(self.backoff_seconds * (2 ** (attempt - 1)))
+            pending = retry
+
+        return results
+
+    def _execute_batch(self, kind, chunk, params):
+        """Execute one batch request. Returns (results, failures, ids to retry) of this batch only."""
+        results, failures, retry = {}, {}, []
+        service = self.service
+        users = service.users()
+        resource = users.messages() if kind == 'messages' else users.threads()
+
+        def callback(request_id, response, exception):
+            if exception is None:
+                results[request_id] = response
+            elif self._is_retryable(exception):
+                retry.append(request_id)
+            else:
+                failures[request_id] = str(exception)
+                logging.error(f"Batch fetch failed for {request_id}: {str(exception)}")
+
+        batch = service.new_batch_http_request(callback=callback)
+        for item_id in chunk:
+            batch.add(resource.get(userId='me', id=item_id, **params), request_id=item_id)
+
+        try:
+            batch.execute()
+        except Exception as e:
+            # The whole batch failed (network error, auth error, ...): retry
+            # everything that did not already get a response.
+            logging.error(f"Error executing batch request: {str(e)}")
+            done = set(results) | set(retry) | set(failures)
+            retry.extend(item_id for item_id in chunk if item_id not in done)
+
+        return results, failures, retry
+
+    @staticmethod
+    def _is_retryable(exception):
+        if isinstance(exception, HttpError):
+            return getattr(exception.resp, 'status', None) in RETRYABLE_STATUSES
+        return True
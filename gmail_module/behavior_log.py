@@ -0,0 +1,419 @@
+import os
+import json
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+from collections import Counter
+from datetime import datetime, timedelta
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Events per segment before the active segment is sealed and a new one started
+SEGMENT_MAX_EVENTS = 5000
+# Every INDEX_STRIDE-th event of a segment is kept in the sparse timestamp index
+INDEX_STRIDE = 256
+# Sealed segments older than this many days keep only their rollups (see compact)
+KEEP_RAW_DAYS = 90
+
+
+def _add_to_rollup(rollup, event):
+    """Count an event in a {action: {email_id: [count, first, last]}} rollup."""
+    entry = rollup.setdefault(event['action'], {}).get(event['email_id'])
+    if entry is None:
+        rollup[event['action']][event['email_id']] = [1, event['timestamp'], event['timestamp']]
+    else:
+        entry[0] += 1
+        entry[1] = min(entry[1], event['timestamp'])
+        entry[2] = max(entry[2], event['timestamp'])
+
+
+def _lock_file(lock_file):
+    """Block until this process holds the exclusive lock on lock_file."""
+    if fcntl is not None:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        return
+    lock_file.seek(0)
+    while True:
+        try:
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            return
+        except OSError:
+            # LK_LOCK gives up after about ten seconds
+            continue
+
+
+def _unlock_file(lock_file):
+    if fcntl is not None:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+    else:
+        lock_file.seek(0)
+        msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _stamp(path):
+    """Identity of a file's current version: (inode, size, mtime), or None if it does not exist."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+def _merge_rollups(target, source):
+    for action, emails in source.items():
+        target_emails = target.setdefault(action, {})
+        for email_id, (count, first, last) in emails.items():
+            entry = target_emails.get(email_id)
+            if entry is None:
+                target_emails[email_id] = [count, first, last]
+            else:
+                entry[0] += count
+                entry[1] = min(entry[1], first)
+                entry[2] = max(entry[2], last)
+
+
+class BehaviorLog:
+    """Segmented, append-only log of {email_id, action, timestamp} events.
+
+    Events are appended as JSON lines to `active.jsonl` under log_dir. After
+    SEGMENT_MAX_EVENTS events the active file is sealed into
+    `segments/<n>.jsonl` next to `<n>.rollup.json`, its per-action, per-email
+    counts with first and last timestamps. `index.json` lists the sealed
+    segments with their time range and a sparse (timestamp, byte offset)
+    index of every INDEX_STRIDE-th event.
+
+    A query for a time window skips segments that end before it, answers
+    from the rollup of segments entirely inside it, and reads raw events only
+    from the one segment it starts in, seeking there through the sparse index.
+    compact() drops the raw events of old segments and merges their rollups;
+    it runs after every seal for segments older than keep_raw_days.
+
+    Several processes may share a log: every write and read holds an
+    exclusive lock on `<log_dir>/lock` and first catches up on index.json
+    and active.jsonl changes made by the others.
+
+    The legacy single-file log (`<log_dir>.json` by default) is imported the
+    first time the log is opened; the legacy file itself is left alone.
+    """
+
+    def __init__(self, log_dir="user_behavior_log", legacy_path=None, segment_max_events=SEGMENT_MAX_EVENTS,
+                 keep_raw_days=KEEP_RAW_DAYS):
+        self.log_dir = log_dir
+        self.legacy_path = legacy_path or log_dir.rstrip("/\\") + ".json"
+        self.segment_max_events = segment_max_events
+        # Raw events older than this are compacted after each seal (None keeps them all)
+        self.keep_raw_days = keep_raw_days
+        self._segments_dir = os.path.join(log_dir, "segments")
+        self._index_path = os.path.join(log_dir, "index.json")
+        self._active_path = os.path.join(log_dir, "active.jsonl")
+        self._lock = threading.RLock()
+        self._lock_depth = 0
+        self._index = {'segments': [], 'next_segment': 1, 'migrated_from': None}
+        self._index_stamp = None
+
+        os.makedirs(self._segments_dir, exist_ok=True)
+        self._lock_file = open(os.path.join(log_dir, "lock"), 'a+b')
+        self._reset_active()
+        with self._locked():
+            if self._index['migrated_from'] is None and os.path.exists(self.legacy_path):
+                self._migrate_legacy()
+
+    @contextmanager
+    def _locked(self):
+        """Hold the thread and process locks, catching up on other processes' writes on entry."""
+        with self._lock:
+            if self._lock_depth == 0:
+                _lock_file(self._lock_file)
+            self._lock_depth += 1
+            try:
+                if self._lock_depth == 1:
+                    self._refresh()
+                yield
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0:
+                    _unlock_file(self._lock_file)
+
+    def _refresh(self):
+        """Reload index.json and the active file if another process changed them."""
+        index_stamp = _stamp(self._index_path)
+        if index_stamp is not None and index_stamp != self._index_stamp:
+            with open(self._index_path) as f:
+                self._index = json.load(f)
+            self._index_stamp = index_stamp
+        active_stamp = _stamp(self._active_path)
+        if active_stamp is None:
+            if self._active_count:
+                self._load_active()
+        elif active_stamp[0] != self._active_ino or active_stamp[1] < self._active_size:
+            # Sealed and restarted by another process
+            self._load_active()
+        elif active_stamp[1] > self._active_size:
+            self._read_active(self._active_size)
+
+    # Writes
+
+    def record(self, email_id, action, timestamp=None):
+        """Append one event; timestamp defaults to now."""
+        self.record_many([{'email_id': email_id, 'action': action,
+                           'timestamp': timestamp or datetime.now().isoformat()}])
+
+    def record_many(self, events):
+        """Append events (dicts with email_id, action and timestamp) in order."""
+        with self._locked():
+            events = list(events)
+            while events:
+                room = self.segment_max_events - self._active_count
+                batch, events = events[:room], events[room:]
+                with open(self._active_path, 'ab') as active:
+                    self._active_ino = os.fstat(active.fileno()).st_ino
+                    for event in batch:
+                        line = (json.dumps({'email_id': event['email_id'], 'action': event['action'],
+                                            'timestamp': event['timestamp']}) + "\n").encode()
+                        self._track_active(event, self._active_size)
+                        active.write(line)
+                        self._active_size += len(line)
+                if self._active_count >= self.segment_max_events:
+                    self._seal()
+
+    def _reset_active(self):
+        self._active_count = 0
+        self._active_size = 0
+        self._active_rollup = {}
+        self._active_sparse = []
+        self._active_range = [None, None]
+        self._active_ino = None
+
+    def _load_active(self):
+        self._reset_active()
+        if os.path.exists(self._active_path):
+            self._read_active(0)
+
+    def _read_active(self, offset):
+        """Track the events of the active file from byte offset on."""
+        with open(self._active_path, 'rb') as active:
+            self._active_ino = os.fstat(active.fileno()).st_ino
+            active.seek(offset)
+            for line in active:
+                try:
+                    event = json.loads(line)
+                except json.JSONDecodeError:
+                    # A write cut short by a crash; the next append starts a fresh line
+                    self._active_size += len(line)
+                    continue
+                self._track_active(event, self._active_size)
+                self._active_size += len(line)
+
+    def _track_active(self, event, offset):
+        if self._active_count % INDEX_STRIDE == 0:
+            self._active_sparse.append([event['timestamp'], offset])
+        self._active_count += 1
+        _add_to_rollup(self._active_rollup, event)
+        first, last = self._active_range
+        self._active_range = [min(first or event['timestamp'], event['timestamp']),
+                              max(last or event['timestamp'], event['timestamp'])]
+
+    def _seal(self):
+        """Turn the active file into a sealed segment with its rollup and index entry."""
+        if not self._active_count:
+            return
+        name = f"{self._index['next_segment']:06d}"
+        with open(os.path.join(self._segments_dir, f"{name}.rollup.json"), 'w') as f:
+            json.dump(self._active_rollup, f)
+        os.replace(self._active_path, os.path.join(self._segments_dir, f"{name}.jsonl"))
+        self._index['segments'].append({
+            'name': name,
+            'first': self._active_range[0],
+            'last': self._active_range[1],
+            'events': self._active_count,
+            'raw': True,
+            'sparse': self._active_sparse
+        })
+        self._index['next_segment'] += 1
+        self._save_index()
+        self._load_active()
+        if self.keep_raw_days is not None:
+            self.compact(self.keep_raw_days)
+
+    def _save_index(self):
+        temp_path = self._index_path + ".tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(self._index, f)
+        os.replace(temp_path, self._index_path)
+        self._index_stamp = _stamp(self._index_path)
+
+    def _migrate_legacy(self):
+        """Import the legacy JSON-lines log, oldest event first."""
+        events = []
+        with open(self.legacy_path) as legacy:
+            for line in legacy:
+                try:
+                    event = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if event.get('email_id') and event.get('action') and event.get('timestamp'):
+                    events.append(event)
+        events.sort(key=lambda event: event['timestamp'])
+        with self._locked():
+            self.record_many(events)
+            self._index['migrated_from'] = self.legacy_path
+            self._save_index()
+        logging.info(f"Migrated {len(events)} behavior log events from {self.legacy_path} to {self.log_dir}.")
+
+    def compact(self, keep_raw_days=KEEP_RAW_DAYS):
+        """Drop raw events of segments older than keep_raw_days and merge their rollups.
+
+        Compacted history still answers rollup queries, resolved per email by
+        its last event time, but no longer yields individual events. Merged
+        rollups are written under new names and the index is saved before any
+        old file is removed, so an interruption never leaves the index
+        pointing at missing files.
+        """
+        cutoff = (datetime.now() - timedelta(days=keep_raw_days)).isoformat()
+        with self._locked():
+            groups, group = [], None
+            for segment in self._index['segments']:
+                if segment['raw'] and segment['last'] >= cutoff:
+                    group = None
+                    groups.append([segment])
+                elif group is None:
+                    group = [segment]
+                    groups.append(group)
+                else:
+                    group.append(segment)
+
+            compacted, changed = [], False
+            for group in groups:
+                first = group[0]
+                if len(group) == 1 and (not first['raw'] or first['last'] >= cutoff):
+                    compacted.append(first)
+                    continue
+                if len(group) == 1:
+                    # Only the raw events go; the rollup file stays as it is
+                    compacted.append(dict(first, raw=False, sparse=[]))
+                    changed = True
+                    continue
+                rollup = self._read_rollup(first)
+                for segment in group[1:]:
+                    _merge_rollups(rollup, self._read_rollup(segment))
+                name = f"{self._index['next_segment']:06d}"
+                self._index['next_segment'] += 1
+                with open(os.path.join(self._segments_dir, f"{name}.rollup.json"), 'w') as f:
+                    json.dump(rollup, f)
+                compacted.append({
+                    'name': name,
+                    'first': min(segment['first'] for segment in group),
+                    'last': max(segment['last'] for segment in group),
+                    'events': sum(segment['events'] for segment in group),
+                    'raw': False,
+                    'sparse': []
+                })
+                changed = True
+            if changed:
+                self._index['segments'] = compacted
+                self._save_index()
+            self._remove_unreferenced_files()
+
+    def _remove_unreferenced_files(self):
+        """Delete segment files the index no longer uses, including those left by an interrupted compact.
+
+        Names from next_segment on belong to a seal or merge the index has not
+        recorded yet and are left alone.
+        """
+        referenced = set()
+        for segment in self._index['segments']:
+            referenced.add(f"{segment['name']}.rollup.json")
+            if segment['raw']:
+                referenced.add(f"{segment['name']}.jsonl")
+        for file_name in os.listdir(self._segments_dir):
+            number = file_name.split(".")[0]
+            if file_name.endswith((".jsonl", ".rollup.json")) and file_name not in referenced \
+                    and number.isdigit() and int(number) < self._index['next_segment']:
+                os.remove(os.path.join(self._segments_dir, file_name))
+
+    def close(self):
+        with self._lock:
+            self._lock_file.close()
+
+    # Reads
+
+    @staticmethod
+    def _since(days):
+        return (datetime.now() - timedelta(days=days)).isoformat() if days is not None else None
+
+    def _read_rollup(self, segment):
+        with open(os.path.join(self._segments_dir, f"{segment['name']}.rollup.json")) as f:
+            return json.load(f)
+
+    def _read_raw(self, path, sparse, since, action=None):
+        """Yield events of a raw segment file at or after since, starting at the sparse index."""
+        offset = 0
+        if since is not None and sparse:
+            position = bisect.bisect_left([timestamp for timestamp, _ in sparse], since)
+            offset = sparse[max(position - 1, 0)][1]
+        with open(path, 'rb') as segment:
+            segment.seek(offset)
+            for line in segment:
+                try:
+                    event = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if since is not None and event['timestamp'] < since:
+                    continue
+                if action is None or event['action'] == action:
+                    yield event
+
+    def _sources(self, since):
+        """Yield (segment, raw path or None) for the sealed segments and the active file that reach since."""
+        for segment in self._index['segments']:
+            if since is None or segment['last'] >= since:
+                yield segment, os.path.join(self._segments_dir, f"{segment['name']}.jsonl") \
+                    if segment['raw'] else None
+        if self._active_count and (since is None or self._active_range[1] >= since):
+            yield {'first': self._active_range[0], 'sparse': self._active_sparse, 'active': True}, \
+                self._active_path
+
+    def iter_events(self, days=None, action=None):
+        """Yield raw events of the last `days` days (all events if None), oldest first."""
+        since = self._since(days)
+        with self._locked():
+            sources = list(self._sources(since))
+        for segment, path in sources:
+            if path is not None:
+                yield from self._read_raw(path, segment['sparse'], since, action)
+
+    def rollup(self, days=None):
+        """Return {action: {email_id: count}} over the last `days` days (all history if None)."""
+        since = self._since(days)
+        totals = {}
+        with self._locked():
+            for segment, path in self._sources(since):
+                inside = since is None or segment['first'] >= since
+                if segment.get('active') and inside:
+                    rollup = self._active_rollup
+                elif inside or path is None:
+                    rollup = self._read_rollup(segment)
+                else:
+                    # The window starts inside this segment: count its raw events from there
+                    for event in self._read_raw(path, segment['sparse'], since):
+                        emails = totals.setdefault(event['action'], Counter())
+                        emails[event['email_id']] += 1
+                    continue
+                for action, emails in rollup.items():
+                    counts = totals.setdefault(action, Counter())
+                    for email_id, (count, _, last) in emails.items():
+                        if since is None or last >= since:
+                            counts[email_id] += count
+        return totals
+
+    def action_counts(self, days=None):
+        """Return a Counter of events per action over the last `days` days."""
+        return Counter({action: sum(emails.values()) for action, emails in self.rollup(days).items()})
+
+    def email_ids(self, action, days=None):
+        """Return the ids of emails with at least one `action` event in the last `days` days."""
+        return set(self.rollup(days).get(action, {}))
@@ -0,0 +1,327 @@
+import os
+import json
+import atexit
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+
+REMINDER_FIELDS = ("flagged", "status", "reminder_time", "reminder_type", "subject")
+
+
+class BehaviorStore:
+    """Sender statistics and reminders in SQLite (WAL) with an in-memory index.
+
+    Reads are served from memory. Writes update memory immediately and are
+    queued, then committed in one transaction when the queue fills up or
+    every `flush_interval` seconds. Counters are written as SQL increments,
+    so the CLI, Flask app and Streamlit UI can share one database without
+    losing each other's updates.
+    """
+
+    def __init__(self, json_path="user_behavior.json", db_path=None,
+                 batch_size=50, flush_interval=2.0):
+        self.json_path = json_path
+        self.db_path = db_path or os.path.splitext(json_path)[0] + ".db"
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._lock = threading.RLock()
+        self._pending = []
+        self._senders = {}
+        self._reminders = {}
+        self._data_version = None
+        self._closed = False
+        self._reload_listeners = []
+
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._create_tables()
+        self._migrate_from_json()
+        self._reload()
+
+        self._stop = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, name="behavior-store-flush", daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+
+    def _create_tables(self):
+        with self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS senders (
+                    sender TEXT PRIMARY KEY,
+                    total_emails INTEGER NOT NULL DEFAULT 0,
+                    responses INTEGER NOT NULL DEFAULT 0,
+                    response_rate REAL NOT NULL DEFAULT 0.0,
+                    last_interaction TEXT,
+                    response_latency REAL
+                )
+            """)
+            columns = {row['name'] for row in self.conn.execute("PRAGMA table_info(senders)")}
+            if 'response_latency' not in columns:
+                # Stores created before response latencies were backfilled
+                self.conn.execute("ALTER TABLE senders ADD COLUMN response_latency REAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS reminders (
+                    message_id TEXT PRIMARY KEY,
+                    sender TEXT,
+                    flagged INTEGER NOT NULL DEFAULT 1,
+                    status TEXT,
+                    reminder_time TEXT,
+                    reminder_type TEXT,
+                    subject TEXT
+                )
+            """)
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                )
+            """)
+
+    def _migrate_from_json(self):
+        """Import the legacy user_behavior.json once."""
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'migrated_from_json'").fetchone()
+        if row is not None or not os.path.exists(self.json_path):
+            return
+
+        try:
+            with open(self.json_path, 'r') as f:
+                legacy = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logging.error(f"Could not migrate behavior file {self.json_path}: {str(e)}")
+            return
+
+        senders, reminders = [], []
+        for sender, sender_data in legacy.items():
+            if not isinstance(sender_data, dict) or not (
+                    'total_emails' in sender_data or 'reminders' in sender_data):
+                continue
+            senders.append((
+                sender,
+                sender_data.get('total_emails', 0),
+                sender_data.get('responses', 0),
+                sender_data.get('response_rate', 0.0),
+                sender_data.get('last_interaction')
+            ))
+            for message_id, reminder in sender_data.get('reminders', {}).items():
+                reminders.append((
+                    message_id, sender,
+                    1 if reminder.get('flagged', False) else 0,
+                    reminder.get('status'),
+                    reminder.get('reminder_time'),
+                    reminder.get('reminder_type'),
+                    reminder.get('subject')
+                ))
+
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO senders (sender, total_emails, responses, response_rate, last_interaction) "
+                "VALUES (?, ?, ?, ?, ?)", senders)
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO reminders VALUES (?, ?, ?, ?, ?, ?, ?)", reminders)
+            self.conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('migrated_from_json', ?)",
+                (datetime.now().isoformat(),))
+        logging.info(f"Migrated {len(senders)} senders and {len(reminders)} reminders "
+                     f"from {self.json_path} to {self.db_path}.")
+
+    def _reload(self):
+        """Rebuild the in-memory index from the database."""
+        self._senders = {
+            row['sender']: {
+                'total_emails': row['total_emails'],
+                'responses': row['responses'],
+                'response_rate': row['response_rate'],
+                'last_interaction': row['last_interaction'],
+                'response_latency': row['response_latency']
+            }
+            for row in self.conn.execute("SELECT * FROM senders")
+        }
+        self._reminders = {
+            row['message_id']: self._reminder_from_row(row)
+            for row in self.conn.execute("SELECT * FROM reminders")
+        }
+        self._data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        for listener in self._reload_listeners:
+            listener()
+
+    def add_reload_listener(self, listener):
+        """Call listener() whenever the index is rebuilt from the database."""
+        self._reload_listeners.append(listener)
+
+    @staticmethod
+    def _reminder_from_row(row):
+        return {
+            'sender': row['sender'],
+            'flagged': bool(row['flagged']),
+            'status': row['status'],
+            'reminder_time': row['reminder_time'],
+            'reminder_type': row['reminder_type'],
+            'subject': row['subject']
+        }
+
+    def _refresh_if_changed(self):
+        """Reload the index if another process committed since the last read."""
+        data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version != self._data_version:
+            self._flush_locked()
+            self._reload()
+
+    # Reads
+
+    def refresh(self):
+        """Pick up commits made by other processes."""
+        with self._lock:
+            self._refresh_if_changed()
+
+    def get_sender(self, sender):
+        """Return a copy of the stats for a sender, or an empty dict."""
+        with self._lock:
+            self._refresh_if_changed()
+            return dict(self._senders.get(sender, {}))
+
+    def get_reminder(self, message_id):
+        with self._lock:
+            self._refresh_if_changed()
+            reminder = self._reminders.get(message_id)
+            return dict(reminder) if reminder else None
+
+    def reminders(self):
+        """Return (message_id, reminder) pairs for every stored reminder."""
+        with self._lock:
+            self._refresh_if_changed()
+            return [(message_id, dict(reminder)) for message_id, reminder in self._reminders.items()]
+
+    # Writes
+
+    def record_interaction(self, sender, action_type):
+        """Count an email from sender, and a response when action_type is 'response_sent'."""
+        responded = 1 if action_type == 'response_sent' else 0
+        now = datetime.now().isoformat()
+        with self._lock:
+            stats = self._senders.setdefault(sender, {
+                'total_emails': 0, 'responses': 0, 'response_rate': 0.0, 'last_interaction': None,
+                'response_latency': None
+            })
+            stats['total_emails'] += 1
+            stats['responses'] += responded
+            stats['response_rate'] = stats['responses'] / stats['total_emails']
+            stats['last_interaction'] = now
+            self._queue("""
+                INSERT INTO senders (sender, total_emails, responses, response_rate, last_interaction)
+                VALUES (?, 1, ?, ?, ?)
+                ON CONFLICT(sender) DO UPDATE SET
+                    total_emails = total_emails + 1,
+                    responses = responses + excluded.responses,
+                    response_rate = CAST(responses + excluded.responses AS REAL) / (total_emails + 1),
+                    last_interaction = excluded.last_interaction
+            """, (sender, responded, float(responded), now))
+
+    def merge_sender_stats(self, stats):
+        """Merge backfilled per-sender stats in one transaction.
+
+        `stats` maps sender -> dict with total_emails, responses, last_interaction
+        and response_latency (mean seconds to reply, or None). Counts keep the
+        larger of the stored and backfilled value, so merging the same history
+        twice, or history that includes already-logged interactions, does not
+        double count.
+        """
+        rows = [(sender, s['total_emails'], s['responses'], s['responses'] / s['total_emails'],
+                 s.get('last_interaction'), s.get('response_latency'))
+                for sender, s in stats.items() if s['total_emails']]
+        with self._lock:
+            self._flush_locked()
+            try:
+                with self.conn:
+                    self.conn.executemany("""
+                        INSERT INTO senders (sender, total_emails, responses, response_rate,
+                                             last_interaction, response_latency)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                        ON CONFLICT(sender) DO UPDATE SET
+                            total_emails = MAX(total_emails, excluded.total_emails),
+                            responses = MAX(responses, excluded.responses),
+                            response_rate = CAST(MAX(responses, excluded.responses) AS REAL) /
+                                            MAX(total_emails, excluded.total_emails, 1),
+                            last_interaction = MAX(COALESCE(last_interaction, ''), excluded.last_interaction),
+                            response_latency = COALESCE(excluded.response_latency, response_latency)
+                    """, rows)
+            except sqlite3.Error as e:
+                logging.error(f"Error merging sender stats: {str(e)}")
+                return 0
+            self._reload()
+        return len(rows)
+
+    def set_reminder(self, sender, message_id, reminder):
+        """Create or replace the reminder for a message."""
+        with self._lock:
+            if sender not in self._senders:
+                self._senders[sender] = {
+                    'total_emails': 0, 'responses': 0, 'response_rate': 0.0, 'last_interaction': None,
+                    'response_latency': None
+                }
+                self._queue("INSERT OR IGNORE INTO senders (sender) VALUES (?)", (sender,))
+            stored = {field: reminder.get(field) for field in REMINDER_FIELDS}
+            stored['sender'] = sender
+            stored['flagged'] = bool(stored['flagged'])
+            self._reminders[message_id] = stored
+            self._queue(
+                "INSERT OR REPLACE INTO reminders VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (message_id, sender, 1 if stored['flagged'] else 0, stored['status'],
+                 stored['reminder_time'], stored['reminder_type'], stored['subject']))
+
+    def update_reminder(self, message_id, **fields):
+        """Update fields of an existing reminder. Returns False if there is none."""
+        fields = {field: value for field, value in fields.items() if field in REMINDER_FIELDS}
+        with self._lock:
+            reminder = self._reminders.get(message_id)
+            if reminder is None or not fields:
+                return False
+            reminder.update(fields)
+            if 'flagged' in fields:
+                fields['flagged'] = 1 if fields['flagged'] else 0
+            assignments = ", ".join(f"{field} = ?" for field in fields)
+            self._queue(f"UPDATE reminders SET {assignments} WHERE message_id = ?",
+                        (*fields.values(), message_id))
+            return True
+
+    # Persistence
+
+    def _queue(self, statement, params):
+        self._pending.append((statement, params))
+        if len(self._pending) >= self.batch_size:
+            self._flush_locked()
+
+    def flush(self):
+        """Commit all queued writes in one transaction."""
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._pending or self._closed:
+            return
+        pending, self._pending = self._pending, []
+        try:
+            with self.conn:
+                for statement, params in pending:
+                    self.conn.execute(statement, params)
+            # Our own commit does not bump data_version, so the index stays valid
+        except sqlite3.Error as e:
+            logging.error(f"Error saving behavior data: {str(e)}")
+            self._pending = pending + self._pending
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def close(self):
+        """Flush pending writes and close the database."""
+        with self._lock:
+            if self._closed:
+                return
+            self._stop.set()
+            self._flush_locked()
+            self._closed = True
+            self.conn.close()
@@ -1,95 +1,86 @@
 import os
-import json
 import pickle
 import logging
 import base64
+import queue
+import threading
 import webbrowser
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from datetime import datetime, timedelta, timezone
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 from transformers import pipeline
-import spacy
+import numpy as np
+from .batch_fetcher import GmailBatchFetcher
+from .result_cache import AnalysisCache
+from .mailbox_mirror import MailboxMirror
+from .behavior_store import BehaviorStore
+from .behavior_log import BehaviorLog
+from .reminder_scheduler import ReminderScheduler
+from .keyword_matcher import KeywordMatcher
+from .key_points import KeyPointExtractor
+from .thread_summarizer import ChunkedSummarizer
+from .mime_walker import extract_body, iter_parts, MAX_BODY_BYTES
+from .service_pool import GmailServicePool
+from .outbox import Outbox
+from .quote_stripper import QuoteStripper
+from .prefilter import MailPrefilter, PREFILTER_HEADERS, message_headers
+from .attachments import (AttachmentStore, attachment_fields, attachment_metadata,
+                          drop_attachment_data)
+from .near_duplicates import NearDuplicateIndex
+from .priority_model import PriorityModel, FEATURE_NAMES
+from .response_suggester import ResponseSuggester
+from .reply_index import ReplyIndex, TransformerEmbedder
+
+# Headers and partial-response mask used for the metadata-only triage pass
+TRIAGE_METADATA_HEADERS = ['Subject', 'From'] + PREFILTER_HEADERS
+TRIAGE_METADATA_FIELDS = 'id,threadId,historyId,labelIds,snippet,payload/headers'
+# Priorities that get a full download and thread summary in two-phase triage
+TRIAGE_FULL_PRIORITIES = ('Urgent', 'Follow-up')
+# Stored thread summaries are updated from (previous summary + new messages) this
+# many times before the whole thread is summarized again to correct drift
+SUMMARY_MAX_INCREMENTAL_UPDATES = 5
+PREFILTER_HEADER_KEYS = {name.lower() for name in PREFILTER_HEADERS}
+# users.messages.list returns at most 500 ids per page
+MAX_LIST_PAGE_SIZE = 500
+# Name prefix of the manager's worker threads
+WORKER_THREAD_PREFIX = "gmail-worker"
+# Sent replies embedded per model call when building the reply index
+REPLY_INDEX_BATCH_SIZE = 64
+# Syncs that retry a message or thread the mirror failed to fetch before giving up on it
+MIRROR_FETCH_MAX_ATTEMPTS = 5
+# Seconds close() waits for queued replies and label removals to go out
+OUTBOX_EXIT_FLUSH_SECONDS = 15.0
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # Load NLP models
 try:
-    nlp = spacy.load("en_core_web_sm")
     sentiment_analyzer = pipeline("sentiment-analysis")
     summarizer = pipeline("summarization", model="facebook/bart-large-cnn")
 except Exception as e:
     logging.error(f"Error loading NLP models: {str(e)}")
-    nlp = None
     sentiment_analyzer = None
     summarizer = None
 
-class ResponseSuggester:
-    """Class to generate response suggestions for emails."""
-    
-    def __init__(self):
-        self.common_responses = {
-            "acknowledgment": "Thank you for your email. I've received it and will get back to you shortly.",
-            "meeting_accept": "I'd be happy to meet with you. The proposed time works for me.",
-            "meeting_reject": "Unfortunately, I won't be able to make that time. Could we find an alternative?",
-            "more_info": "Thank you for reaching out. Could you provide some additional details so I can better assist you?",
-            "follow_up": "I wanted to follow up on our previous conversation. Have you had a chance to review the information I sent?",
-        }
-    
-    def get_suggestions(self, email_content, email_context):
-        """Generate response suggestions based on email content and context."""
-        suggestions = []
-        
-        # Basic acknowledgment (always offer this)
-        suggestions.append({
-            "type": "acknowledgment",
-            "text": self.common_responses["acknowledgment"]
-        })
-        
-        # Check for meeting requests
-        if any(keyword in email_content.lower() for keyword in ["meet", "meeting", "appointment", "schedule", "calendar"]):
-            suggestions.append({
-                "type": "meeting_accept",
-                "text": self.common_responses["meeting_accept"]
-            })
-            suggestions.append({
-                "type": "meeting_reject",
-                "text": self.common_responses["meeting_reject"]
-            })
-        
-        # Check for questions or info requests
-        if "?" in email_content or any(keyword in email_content.lower() for keyword in ["question", "inquiry", "help", "information", "details"]):
-            suggestions.append({
-                "type": "more_info",
-                "text": self.common_responses["more_info"]
-            })
-        
-        # Add custom response based on sender (if we have history)
-        sender = email_context.get('sender', '')
-        if sender:
-            sender_name = sender.split('<')[0].strip()
-            custom_response = f"Hi {sender_name}, thanks for your email about '{email_context.get('subject', '')}'. I'll look into this and get back to you as soon as possible."
-            suggestions.append({
-                "type": "custom_personal",
-                "text": custom_response
-            })
-        
-        # Add priority-based response if marked important
-        if email_context.get('is_important', False):
-            suggestions.append({
-                "type": "priority_response",
-                "text": "I see this is an important matter. I'm prioritizing it and will address it promptly."
-            })
-        
-        return suggestions
+# Shared by every manager's reply index; the model is loaded on first use
+reply_embedder = TransformerEmbedder()
+
+# The model pipelines are shared by all worker threads and are not thread-safe
+model_lock = threading.Lock()
 
 class GmailPriorityManager:
     def __init__(self, credentials_path="credentials.json", token_path="token.pickle",
-                 behavior_file="user_behavior.json"):
+                 behavior_file="user_behavior.json", mirror_path="mailbox_mirror.db",
+                 summary_latency_budget=30.0, max_workers=4, outbox_path="outbox.db",
+                 attachment_cache_dir="attachment_cache", priority_model_path="priority_weights.json",
+                 reply_index_dir="reply_index", behavior_log_dir="user_behavior_log", connect=True):
         self.credentials_path = credentials_path
         self.token_path = token_path
         self.behavior_file = behavior_file
@@ -101,19 +92,91 @@ class GmailPriorityManager:
             "urgent", "asap", "immediate", "emergency", "deadline", "due date",
             "important", "priority", "critical", "crucial"
         }
+        self.keyword_matcher = KeywordMatcher(self.urgent_keywords)
+        # Sentencizer-only spaCy pipeline that ranks sentences by urgent keywords
+        self.key_point_extractor = KeyPointExtractor(self.keyword_matcher)
+        # (thread id, historyId) -> decoded entries and batched key points, see prepare_threads
+        self._prepared_threads = {}
+        # Map-reduce summaries over BART-sized token chunks, bounded in wall time
+        self.thread_summarizer = ChunkedSummarizer(
+            summarizer, latency_budget=summary_latency_budget) if summarizer is not None else None
+        # Removes quoted replies and signatures before summarization (see tokens_saved)
+        self.quote_stripper = QuoteStripper()
+        # Label/header rules that route bulk and promotional mail around the models
+        self.prefilter = MailPrefilter()
+        # Attachments are downloaded only on request, into a content-addressed cache
+        self.attachment_store = AttachmentStore(attachment_cache_dir)
+        # SimHash index of analysed bodies; near-duplicates reuse their keyword counts and summary
+        self.duplicate_index = NearDuplicateIndex()
+        # Linear priority model; trained weights come from train_priority, else the default rule
+        self.priority_model = PriorityModel.load(priority_model_path)
+        self.service_pool = None
         self.service = None
+        # Worker threads for concurrent fetching and processing; the pool lives as
+        # long as the manager so each thread keeps its service and connection
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=WORKER_THREAD_PREFIX) \
+            if max_workers > 1 else None
+        # Largest decoded body (in bytes) passed on to the NLP models
+        self.max_body_bytes = MAX_BODY_BYTES
         # Use a fixed port that must be registered in Google Cloud Console
         self.auth_port = 8080
         self.credentials = None
-        self.response_suggester = ResponseSuggester()
+        # Embeddings of the user's sent replies, searched for suggestions (None disables it)
+        self.reply_index = ReplyIndex(reply_index_dir, embed=reply_embedder) if reply_index_dir else None
+        self.response_suggester = ResponseSuggester(self.reply_index)
         self.reminders = []
-        self.initialize_service()
+        # Analysis results keyed by message/thread id and validated by Gmail historyId
+        self.analysis_cache = AnalysisCache()
+        # Local copy of the mailbox, kept current through history.list (None disables it)
+        self.mirror = MailboxMirror(mirror_path) if mirror_path else None
+        # Sender stats and reminders; migrates behavior_file on first use
+        self.behavior_store = BehaviorStore(behavior_file)
+        # Segmented per-email action log with rollups; imports user_behavior_log.json on first use
+        self.behavior_log = BehaviorLog(behavior_log_dir) if behavior_log_dir else None
+        # Time-ordered index of pending reminders, rebuilt when another process changes the store
+        self.reminder_scheduler = ReminderScheduler()
+        self._load_reminder_schedule()
+        self.behavior_store.add_reload_listener(self._load_reminder_schedule)
+        self.outbox = None
+        self._closed = False
+        # connect=False gives an offline manager (no Gmail API) for analysing local archives
+        if connect:
+            self.initialize_service()
+        if connect and outbox_path:
+            # Background sender for replies and batched UNREAD removals (started once the service
+            # exists); without one, replies are sent and labels removed inline
+            self.outbox = Outbox(
+                send=self._send_outbox_reply,
+                remove_unread=self._remove_unread_labels,
+                on_sent=self._after_reply_sent,
+                db_path=outbox_path
+            )
 
     def initialize_service(self):
         """Initialize Gmail API service with authentication."""
         creds = self._authenticate()
         self.credentials = creds
-        self.service = build("gmail", "v1", credentials=creds)
+        self.service_pool = GmailServicePool(creds, on_refresh=self._save_credentials)
+
+    @property
+    def service(self):
+        """Gmail service for the calling thread; each thread gets its own HTTP connection."""
+        if self.service_pool is not None:
+            return self.service_pool.get()
+        return self._service
+
+    @service.setter
+    def service(self, value):
+        self._service = value
+
+    def _save_credentials(self, creds):
+        """Persist refreshed credentials to the token file."""
+        try:
+            with open(self.token_path, "wb") as token:
+                pickle.dump(creds, token)
+        except Exception as e:
+            logging.error(f"Error saving refreshed credentials: {str(e)}")
 
     def _authenticate(self):
         """Handle Gmail API authentication."""
@@ -142,12 +205,7 @@ class GmailPriorityManager:
     def analyze_sender_history(self, sender_email):
         """Analyze sender's email history for prioritization."""
         try:
-            if not os.path.exists(self.behavior_file):
-                return False
-
-            with open(self.behavior_file, 'r') as f:
-                behavior_data = json.load(f)
-            sender_stats = behavior_data.get(sender_email, {})
+            sender_stats = self.behavior_store.get_sender(sender_email)
             response_rate = sender_stats.get('response_rate', 0)
             return response_rate > 0.7
         except Exception as e:
@@ -173,99 +231,124 @@ class GmailPriorityManager:
 
             subject = headers.get('Subject', '')
             sender = headers.get('From', '')
-            content = ""
-
-            if 'parts' in payload:
-                for part in payload['parts']:
-                    if part['mimeType'] == 'text/plain':
-                        data = part['body'].get('data', '')
-                        content += self.decode_base64(data)
-            else:
-                data = payload.get('body', {}).get('data', '')
-                content = self.decode_base64(data)
+            # Walk the whole MIME tree and decode only the chosen body part
+            content = extract_body(payload, self.max_body_bytes)
 
             return subject, sender, content
         except Exception as e:
             logging.error(f"Error extracting email content: {str(e)}")
             return "", "", ""
 
+    def _decode_message(self, message):
+        """Return (subject, sender, content) for a Gmail API or mirrored message."""
+        if 'payload' not in message and 'content' in message:
+            return message['subject'], message['sender'], message['content']
+        return self.extract_email_content(message)
+
     def analyze_priority(self, email_data):
-        """Analyze email priority using NLP."""
+        """Analyze email priority from urgent keywords, labels and sender history."""
         try:
             subject = email_data.get('subject', '')
             content = email_data.get('content', '')
-            combined_text = f"{subject} {content}".lower()
-
-            # Keyword detection
-            doc = nlp(combined_text)
-            urgent_word_count = sum(1 for token in doc
-                                  if token.text in self.urgent_keywords)
-
-            # Priority scoring
-            priority_score = (
-                (urgent_word_count * 2) +
-                (3 if email_data.get('is_important', False) else 0) +
-                (2 if self.analyze_sender_history(email_data.get('sender', '')) else 0)
-            )
 
-            # Simplified priority classification
-            if priority_score >= 6:
-                return "Urgent"
-            elif priority_score >= 3:
-                return "Follow-up"
-            else:
-                return "Low Priority"
+            # Keyword and phrase detection
+            urgent_word_count = self.keyword_matcher.count_total(f"{subject} {content}")
+            return self._classify_priority(urgent_word_count, email_data)
         except Exception as e:
             logging.error(f"Error analyzing priority: {str(e)}")
             return "Low Priority"
 
-    def summarize_thread(self, thread_id):
-        """Generate a summary of an email thread."""
+    def analyze_priority_batch(self, email_data_list):
+        """Analyze the priority of many emails, scanning all texts for keywords in one pass."""
         try:
-            thread = self.service.users().threads().get(
-                userId='me', id=thread_id).execute()
+            if not email_data_list:
+                return []
+            keyword_features = self.keyword_matcher.scan_batch(
+                [f"{email_data.get('subject', '')} {email_data.get('content', '')}"
+                 for email_data in email_data_list])
+            # One vectorized pass over the whole batch
+            return self.priority_model.classify(self.priority_features(
+                email_data_list, [feature['total'] for feature in keyword_features]))
+        except Exception as e:
+            logging.error(f"Error analyzing priority batch: {str(e)}")
+            return ["Low Priority"] * len(email_data_list)
+
+    def _classify_priority(self, urgent_word_count, email_data):
+        """Turn a keyword count and email metadata into a priority label."""
+        return self.priority_model.classify(self.priority_features([email_data], [urgent_word_count]))[0]
+
+    def priority_features(self, email_data_list, urgent_word_counts, with_sentiment=None):
+        """Build the priority feature matrix (one row per email, columns as in FEATURE_NAMES)."""
+        features = np.zeros((len(email_data_list), len(FEATURE_NAMES)))
+        features[:, 0] = urgent_word_counts
+        for row, email_data in enumerate(email_data_list):
+            response_rate = self.behavior_store.get_sender(email_data.get('sender', '')).get('response_rate', 0)
+            features[row, 1] = email_data.get('is_important', False)
+            features[row, 2] = response_rate > 0.7
+            features[row, 3] = response_rate
+            features[row, 5] = np.log1p(email_data.get('thread_length', 1))
+        # Sentiment is the expensive column: by default only run the model when the weights use it
+        if with_sentiment is None:
+            with_sentiment = self.priority_model.uses('negative_sentiment')
+        if with_sentiment:
+            features[:, 4] = self._negative_sentiment(
+                [f"{email_data.get('subject', '')} {email_data.get('content', '')}" for email_data in email_data_list])
+        return features
+
+    def _negative_sentiment(self, texts, batch_size=32):
+        """Return the NEGATIVE probability of each text, scored in batches."""
+        if sentiment_analyzer is None or not texts:
+            return np.zeros(len(texts))
+        try:
+            with model_lock:
+                outputs = sentiment_analyzer([text[:1000] for text in texts], batch_size=batch_size, truncation=True)
+            return np.array([output['score'] if output['label'] == 'NEGATIVE' else 1 - output['score']
+                             for output in outputs])
+        except Exception as e:
+            logging.error(f"Error analyzing sentiment: {str(e)}")
+            return np.zeros(len(texts))
 
+    def summarize_thread(self, thread_id, thread=None):
+        """Generate a summary of an email thread."""
+        try:
+            if thread is None and self.mirror is not None:
+                mirrored = self.mirror.get_thread_messages(thread_id)
+                if mirrored:
+                    thread = {
+                        'id': thread_id,
+                        'historyId': str(max(int(m['historyId']) for m in mirrored)),
+                        'messages': mirrored
+                    }
+
+            if thread is not None:
+                history_id = thread.get('historyId')
+            else:
+                history_id = self._probe_history_id('thread', thread_id)
+            cached = self.analysis_cache.get(('thread', thread_id), history_id)
+            if cached is not None:
+                return cached
+
+            if thread is None:
+                thread = self.service.users().threads().get(
+                    userId='me', id=thread_id).execute()
+
+            # Threads of a bulk call arrive decoded, with their key points extracted in one batch
+            prepared = self._prepared_threads.pop((thread_id, history_id), None)
+            subject, participants, entries, key_points = prepared or (self._thread_entries(thread) + (None,))
             thread_summary = {
-                'subject': '',
-                'participants': set(),
+                'subject': subject,
+                'participants': participants,
                 'summary': '',
                 'key_points': [],
                 'latest_update': '',
                 'message_count': len(thread['messages'])
             }
 
-            messages = []
-            for message in thread['messages']:
-                subject, sender, content = self.extract_email_content(message)
-                if subject:
-                    thread_summary['subject'] = subject
-                if sender:
-                    thread_summary['participants'].add(sender)
-                if content:
-                    messages.append(content)
-
+            messages = [content for _, content in entries]
             full_content = " ".join(messages)
-            if len(full_content) > 100 and summarizer is not None:
-                # Generate overall summary
-                thread_summary['summary'] = summarizer(
-                    full_content[:1024],
-                    max_length=120,
-                    min_length=30,
-                    do_sample=False
-                )[0]['summary_text']
-
-                # Extract key points using spaCy
-                if nlp is not None:
-                    doc = nlp(full_content[:2000])
-                    sentences = [sent.text.strip() for sent in doc.sents]
-
-                    # Select key points (important sentences)
-                    for sent in sentences:
-                        if any(keyword in sent.lower() for keyword in self.urgent_keywords):
-                            thread_summary['key_points'].append(sent)
-
-                    # Limit key points
-                    thread_summary['key_points'] = thread_summary['key_points'][:3]
+            if len(full_content) > 100 and self.thread_summarizer is not None:
+                thread_summary['summary'], thread_summary['key_points'] = \
+                    self._summarize_thread_content(thread_id, entries, key_points)
 
                 # Add latest update
                 if messages:
@@ -273,6 +356,7 @@ class GmailPriorityManager:
             else:
                 thread_summary['summary'] = full_content
 
+            self.analysis_cache.put(('thread', thread_id), thread.get('historyId'), thread_summary)
             return thread_summary
         except Exception as e:
             logging.error(f"Error summarizing thread: {str(e)}")
@@ -285,13 +369,160 @@ class GmailPriorityManager:
                 'message_count': 0
             }
 
-    def process_new_email(self, message_id):
+    def _duplicate_thread_summary(self, email_data, analysed_summary, thread=None):
+        """Build the thread summary of a near-duplicate email, reusing only the analysed summary text."""
+        if thread is None and self.mirror is not None:
+            mirrored = self.mirror.get_thread_messages(email_data['thread_id'])
+            thread = {'messages': mirrored} if mirrored else None
+        if thread is None and email_data.get('thread_id'):
+            # Headers only: the summary text is reused, so no bodies are needed
+            thread = self.service.users().threads().get(
+                userId='me', id=email_data['thread_id'], format='metadata',
+                metadataHeaders=['From', 'Subject']).execute()
+
+        subject = email_data['subject']
+        participants = {email_data['sender']} if email_data['sender'] else set()
+        latest = email_data['content']
+        message_count = 1
+        if thread is not None and thread.get('messages'):
+            # Header fields and the count come from this email's own thread, no model calls
+            message_count = len(thread['messages'])
+            for message in thread['messages']:
+                message_subject, sender, content = self._decode_message(message)
+                if message_subject:
+                    subject = message_subject
+                if sender:
+                    participants.add(sender)
+                if content:
+                    latest = content
+
+        return {
+            'subject': subject,
+            'participants': participants,
+            'summary': analysed_summary.get('summary', ''),
+            'key_points': list(analysed_summary.get('key_points', [])),
+            'latest_update': latest[:200] + "..." if latest else '',
+            'message_count': message_count
+        }
+
+    def _thread_entries(self, thread):
+        """Return (subject, participants, [(message_id, stripped content)]) of a thread."""
+        subject = ''
+        participants = set()
+        message_ids = []
+        messages = []
+        for message in thread['messages']:
+            message_subject, sender, content = self._decode_message(message)
+            if message_subject:
+                subject = message_subject
+            if sender:
+                participants.add(sender)
+            if content:
+                message_ids.append(message['id'])
+                messages.append(content)
+
+        # Drop quoted chains, signatures and disclaimers so each message counts once
+        entries = [(message_id, content) for message_id, content
+                   in zip(message_ids, self.quote_stripper.strip_thread(messages)) if content]
+        return subject, participants, entries
+
+    def prepare_threads(self, threads):
+        """Decode threads about to be summarized and extract their key points in one batch.
+
+        summarize_thread picks the prepared data up instead of decoding the
+        thread again. Returns the keys stored; pass them to
+        discard_prepared_threads once the threads are processed.
+        """
+        prepared, texts = {}, {}
+        for thread in threads:
+            key = (thread['id'], thread.get('historyId'))
+            if key in prepared or self.analysis_cache.get(('thread', key[0]), key[1]) is not None:
+                continue
+            prepared[key] = self._thread_entries(thread) + (None,)
+            full_content = " ".join(content for _, content in prepared[key][2])
+            if len(full_content) > 100 and self.thread_summarizer is not None:
+                texts[key] = full_content
+        if texts:
+            for key, key_points in zip(texts, self.key_point_extractor.extract_batch(list(texts.values()))):
+                prepared[key] = prepared[key][:3] + (key_points,)
+        self._prepared_threads.update(prepared)
+        return list(prepared)
+
+    def discard_prepared_threads(self, keys):
+        """Drop prepared threads that were never summarized (cache hits, duplicates)."""
+        for key in keys:
+            self._prepared_threads.pop(key, None)
+
+    def _summarize_thread_content(self, thread_id, entries, key_points=None):
+        """Return (summary, key_points) for a thread's (message_id, content) pairs.
+
+        When a stored summary covers an earlier part of the thread, only the new
+        messages are summarized together with it; the whole thread is summarized
+        again after SUMMARY_MAX_INCREMENTAL_UPDATES updates, when the input no
+        longer fits one model call, or when covered messages have disappeared.
+        """
+        message_ids = [message_id for message_id, _ in entries]
+        stored = self.mirror.get_thread_summary(thread_id) if self.mirror is not None else None
+
+        if stored is not None and set(stored['message_ids']) <= set(message_ids):
+            covered = set(stored['message_ids'])
+            new_content = " ".join(content for message_id, content in entries if message_id not in covered)
+            if not new_content:
+                # Nothing new (e.g. only labels changed): the stored summary is still current
+                return stored['summary'], stored['key_points']
+
+            update_input = stored['summary'] + " " + new_content
+            summary = None
+            if stored['incremental_updates'] < SUMMARY_MAX_INCREMENTAL_UPDATES:
+                # The tokenizer is part of the shared pipeline, so the check needs the lock too
+                with model_lock:
+                    if self.thread_summarizer.fits_one_call(update_input):
+                        summary = self.thread_summarizer.summarize(update_input)
+            if summary is not None:
+                key_points = self.key_point_extractor.merge(stored['key_points'], new_content)
+                self.mirror.save_thread_summary(thread_id, message_ids, summary, key_points,
+                                                stored['incremental_updates'] + 1)
+                return summary, key_points
+
+        full_content = " ".join(content for _, content in entries)
+        with model_lock:
+            summary = self.thread_summarizer.summarize(full_content)
+        if key_points is None:
+            key_points = self._extract_key_points(full_content)[:3]
+        if self.mirror is not None:
+            self.mirror.save_thread_summary(thread_id, message_ids, summary, key_points)
+        return summary, key_points
+
+    def _extract_key_points(self, text):
+        """Return the sentences of text with the most urgent keywords, best three in text order."""
+        return self.key_point_extractor.extract(text)
+
+    def process_new_email(self, message_id, message=None, thread=None):
         """Process a new email and return its priority and summary."""
         try:
-            message = self.service.users().messages().get(
-                userId='me', id=message_id).execute()
+            if message is None and self.mirror is not None:
+                message = self.mirror.get_message(message_id)
+
+            if message is not None:
+                history_id = message.get('historyId')
+            else:
+                history_id = self._probe_history_id('message', message_id)
+            cached = self.analysis_cache.get(('message', message_id), history_id)
+            if cached is not None:
+                if cached.get('thread_summary') is not None:
+                    # Prefiltered mail or a near-duplicate: the stored result is complete
+                    return dict(cached)
+                return {
+                    'priority': cached['priority'],
+                    'thread_summary': self.summarize_thread(cached['email_data']['thread_id'], thread=thread),
+                    'email_data': cached['email_data']
+                }
+
+            if message is None:
+                message = self.service.users().messages().get(
+                    userId='me', id=message_id).execute()
 
-            subject, sender, content = self.extract_email_content(message)
+            subject, sender, content = self._decode_message(message)
             is_important = self.check_importance(message)
 
             email_data = {
@@ -303,8 +534,33 @@ class GmailPriorityManager:
                 'message_id': message_id
             }
 
-            priority = self.analyze_priority(email_data)
-            thread_summary = self.summarize_thread(email_data['thread_id'])
+            reason = self._prefilter_reason(message, sender)
+            if reason is not None:
+                self.prefilter.record(reason)
+                email_data['prefilter_reason'] = reason
+                result = self._metadata_result(message, email_data, "Low Priority", flag_reminder=False)
+                self.analysis_cache.put(('message', message_id), message.get('historyId'), result)
+                return result
+
+            fingerprint = self.duplicate_index.fingerprint(f"{subject} {content}")
+            duplicate = self.duplicate_index.find(fingerprint) if fingerprint is not None else None
+            if duplicate is not None and duplicate[0] != message_id:
+                # Near-identical to an analysed email: reuse its keyword count and summary
+                duplicate_id, analysed = duplicate
+                email_data['duplicate_of'] = duplicate_id
+                thread_summary = self._duplicate_thread_summary(email_data, analysed['thread_summary'], thread)
+                email_data['thread_length'] = thread_summary.get('message_count') or 1
+                priority = self._classify_priority(analysed['urgent_word_count'], email_data)
+            else:
+                urgent_word_count = self.keyword_matcher.count_total(f"{subject} {content}")
+                thread_summary = self.summarize_thread(email_data['thread_id'], thread=thread)
+                email_data['thread_length'] = thread_summary.get('message_count') or 1
+                priority = self._classify_priority(urgent_word_count, email_data)
+                if fingerprint is not None:
+                    self.duplicate_index.add(message_id, fingerprint, {
+                        'urgent_word_count': urgent_word_count,
+                        'thread_summary': thread_summary
+                    })
 
             # Automatically create reminder for unread emails
             if 'UNREAD' in message.get('labelIds', []):
@@ -312,6 +568,12 @@ class GmailPriorityManager:
                 reminder_time = datetime.now(timezone.utc) + timedelta(hours=5)
                 self.flag_email_for_reminder(email_data, reminder_time.isoformat())
 
+            if 'duplicate_of' in email_data:
+                cached_value = {'priority': priority, 'thread_summary': thread_summary, 'email_data': email_data}
+            else:
+                cached_value = {'priority': priority, 'email_data': email_data}
+            self.analysis_cache.put(('message', message_id), message.get('historyId'), cached_value)
+
             return {
                 'priority': priority,
                 'thread_summary': thread_summary,
@@ -331,28 +593,578 @@ class GmailPriorityManager:
                 'email_data': {}
             }
 
-    def get_unread_emails(self, max_results=10):
+    def list_attachments(self, message_id, message=None):
+        """Return attachment metadata of a message without downloading any body data."""
+        try:
+            if message is None or 'payload' not in message:
+                message = self.service.users().messages().get(
+                    userId='me', id=message_id, fields=attachment_fields()).execute()
+            return attachment_metadata(message['payload'])
+        except Exception as e:
+            logging.error(f"Error listing attachments of {message_id}: {str(e)}")
+            return []
+
+    def get_attachment(self, message_id, attachment, truncate=False):
+        """Download an attachment into the attachment cache on demand and return its file record.
+
+        Attachments larger than the store's size limit are skipped (None is
+        returned) unless truncate is set, in which case only the first
+        max_bytes are kept.
+        """
+        try:
+            cached = self.attachment_store.lookup(message_id, attachment['part_id'])
+            if cached is not None:
+                return cached
+            if attachment.get('size', 0) > self.attachment_store.max_bytes and not truncate:
+                logging.warning(f"Skipping attachment {attachment.get('filename')} of {message_id}: "
+                                f"{attachment.get('size')} bytes exceeds the size limit.")
+                return None
+
+            if attachment.get('attachment_id'):
+                response = self.service.users().messages().attachments().get(
+                    userId='me', messageId=message_id, id=attachment['attachment_id']).execute()
+                data = response.get('data', '')
+            else:
+                # Small parts carry their data inline in the message
+                message = self.service.users().messages().get(userId='me', id=message_id).execute()
+                part = next((part for part in iter_parts(message['payload'])
+                             if part.get('partId') == attachment['part_id']), {})
+                data = part.get('body', {}).get('data', '')
+            return self.attachment_store.save(message_id, attachment['part_id'], data)
+        except Exception as e:
+            logging.error(f"Error downloading attachment of {message_id}: {str(e)}")
+            return None
+
+    def _probe_history_id(self, kind, item_id):
+        """Fetch only the current historyId of a message or thread."""
+        try:
+            users = self.service.users()
+            resource = users.messages() if kind == 'message' else users.threads()
+            response = resource.get(userId='me', id=item_id, format='minimal',
+                                    fields='historyId').execute()
+            return response.get('historyId')
+        except Exception as e:
+            logging.error(f"Error fetching history id for {kind} {item_id}: {str(e)}")
+            return None
+
+    def get_unread_emails(self, max_results=10, two_phase=True):
         """Get a list of unread emails."""
         try:
-            results = self.service.users().messages().list(
-                userId='me',
-                q='is:unread',
-                maxResults=max_results
-            ).execute()
-            
-            messages = results.get('messages', [])
-            unread_emails = []
-            
-            for message_data in messages:
-                message_id = message_data['id']
-                email_info = self.process_new_email(message_id)
-                unread_emails.append(email_info)
-                
-            return unread_emails
+            message_ids = self.get_recent_message_ids(max_results, unread_only=True)
+            if two_phase:
+                return self.triage_emails(message_ids)
+            return self.process_emails_bulk(message_ids)
         except Exception as e:
             logging.error(f"Error getting unread emails: {str(e)}")
             return []
 
+    def get_recent_message_ids(self, max_results=10, unread_only=False):
+        """List recent message ids, from the synced mirror when available."""
+        if self.mirror is not None:
+            self.sync_mailbox()
+            if self.mirror.get_history_id() is not None:
+                return self.mirror.recent_message_ids(
+                    max_results, label_id='UNREAD' if unread_only else None)
+
+        return list(self.iter_message_ids(query='is:unread' if unread_only else None, limit=max_results))
+
+    def iter_message_ids(self, query=None, label_ids=None, limit=None, page_size=100, prefetch=True):
+        """Yield message ids from every result page, newest first, up to `limit` ids.
+
+        Follows nextPageToken through the whole result set. With prefetch the
+        next page is listed on a background thread while the current one is
+        consumed; at most one page waits in memory.
+        """
+        if limit is not None and limit <= 0:
+            return
+        params = {'userId': 'me', 'maxResults': min(page_size, limit or page_size, MAX_LIST_PAGE_SIZE)}
+        if query:
+            params['q'] = query
+        if label_ids:
+            params['labelIds'] = label_ids
+
+        pages = self._prefetch(lambda stop: self._list_pages(params, stop), name="gmail-list-prefetch") \
+            if prefetch else self._list_pages(params)
+        yielded = 0
+        try:
+            for page in pages:
+                for message_id in page:
+                    yield message_id
+                    yielded += 1
+                    if limit is not None and yielded >= limit:
+                        return
+        finally:
+            pages.close()
+
+    def iter_triaged_emails(self, query='is:unread', limit=None, chunk_size=25, group_duplicates=False,
+                            lookahead=0):
+        """Return a generator of (message_id, result) for every matching message, triaged chunk by chunk.
+
+        The mirror, if any, is synced first so triage reads mirrored messages
+        locally; the ids themselves are listed from the API, since the mirror
+        only holds recent threads.
+        With group_duplicates, each near-duplicate cluster is yielded once (see
+        group_duplicates); clusters already shown in earlier chunks are skipped.
+        With lookahead, triage runs on a background thread and keeps up to that
+        many results ready while the caller works on the current one; closing
+        the generator cancels it after the chunk in progress.
+        """
+        triaged = self._iter_triaged(query, limit, chunk_size, group_duplicates)
+        if not lookahead:
+            return triaged
+        return self._prefetch(lambda stop: triaged, lookahead, name="gmail-triage-prefetch")
+
+    def _iter_triaged(self, query, limit, chunk_size, group_duplicates):
+        shown_clusters = set()
+
+        def triaged(chunk):
+            results = self.triage_emails(chunk)
+            if not group_duplicates:
+                return zip(chunk, results)
+            grouped = []
+            for message_id, result in self.group_duplicates(chunk, results):
+                cluster = result['email_data'].get('duplicate_of') or message_id
+                if cluster not in shown_clusters:
+                    shown_clusters.add(cluster)
+                    grouped.append((message_id, result))
+            return grouped
+
+        self.sync_mailbox()
+        chunk = []
+        for message_id in self.iter_message_ids(query=query, limit=limit):
+            chunk.append(message_id)
+            if len(chunk) >= chunk_size:
+                yield from triaged(chunk)
+                chunk = []
+        if chunk:
+            yield from triaged(chunk)
+
+    def group_duplicates(self, message_ids, results):
+        """Collapse near-duplicate results into one (message_id, result) item per cluster.
+
+        The first message of a cluster represents it; the ids of the others are
+        listed in its result under 'duplicates'.
+        """
+        grouped = OrderedDict()
+        for message_id, result in zip(message_ids, results):
+            cluster = result.get('email_data', {}).get('duplicate_of') or message_id
+            if cluster in grouped:
+                grouped[cluster][1]['duplicates'].append(message_id)
+            else:
+                grouped[cluster] = (message_id, dict(result, duplicates=[]))
+        return list(grouped.values())
+
+    def _list_pages(self, params, stop=None):
+        """Yield the message ids of each messages.list page, following nextPageToken."""
+        page_token = None
+        while stop is None or not stop.is_set():
+            request = dict(params, pageToken=page_token) if page_token else params
+            response = self.service.users().messages().list(**request).execute()
+            yield [message_data['id'] for message_data in response.get('messages', [])]
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                return
+
+    def _prefetch(self, produce_items, maxsize=1, name="gmail-prefetch"):
+        """Yield the items of produce_items(stop) while a background thread keeps up to maxsize ready.
+
+        `stop` is set when the consumer closes the generator; the producer then
+        exits at its next item and its iterator is closed.
+        """
+        items = queue.Queue(maxsize=maxsize)
+        stop = threading.Event()
+        done = object()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    items.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def produce():
+            iterator = iter(produce_items(stop))
+            try:
+                for item in iterator:
+                    if not put(item):
+                        return
+            except Exception as e:
+                logging.error(f"Error in background {name}: {str(e)}")
+            finally:
+                if hasattr(iterator, 'close'):
+                    iterator.close()
+            put(done)
+
+        threading.Thread(target=produce, name=name, daemon=True).start()
+        try:
+            while True:
+                item = items.get()
+                if item is done:
+                    return
+                yield item
+        finally:
+            stop.set()
+
+    def process_emails_bulk(self, message_ids):
+        """Process several emails, fetching messages and threads in batched requests."""
+        messages = {}
+        if self.mirror is not None:
+            for message_id in message_ids:
+                mirrored = self.mirror.get_message(message_id)
+                if mirrored is not None:
+                    messages[message_id] = mirrored
+
+        # Only messages missing from the mirror go to the API; their threads are
+        # fetched in full and mirrored so later reads stay local.
+        fetcher = self._batch_fetcher()
+        fetched = fetcher.get_messages([i for i in message_ids if i not in messages])
+        for message in fetched.values():
+            drop_attachment_data(message.get('payload', {}))
+        messages.update(fetched)
+        # Prefiltered mail is never summarized, so its threads are not needed
+        bulk = [message for message in fetched.values() if self._prefilter_reason(message) is not None]
+        bulk_ids = {message['id'] for message in bulk}
+        threads = fetcher.get_threads(
+            [message.get('threadId') for message in fetched.values() if message['id'] not in bulk_ids])
+        for thread in threads.values():
+            for message in thread.get('messages', []):
+                drop_attachment_data(message.get('payload', {}))
+        if self.mirror is not None and (threads or bulk):
+            self.mirror.upsert_messages(
+                [self._mirror_row(m) for thread in threads.values() for m in thread.get('messages', [])] +
+                [self._mirror_row(m) for m in bulk])
+
+        def process(message_id):
+            message = messages.get(message_id)
+            if message is None:
+                # Fall back to a single request for anything the batch could not fetch
+                return self.process_new_email(message_id)
+            thread = threads.get(message.get('threadId'))
+            return self.process_new_email(message_id, message=message, thread=thread)
+
+        # Messages of one thread run in order on the same worker, so only the first
+        # summarizes the thread and the rest hit the analysis cache
+        groups = OrderedDict()
+        for message_id in message_ids:
+            thread_id = messages.get(message_id, {}).get('threadId') or message_id
+            groups.setdefault(thread_id, []).append(message_id)
+
+        prepared = self.prepare_threads(threads.values())
+        try:
+            grouped = self._map_concurrently(lambda ids: [process(i) for i in ids], list(groups.values()))
+        finally:
+            self.discard_prepared_threads(prepared)
+        results = {}
+        for ids, group_results in zip(groups.values(), grouped):
+            results.update(zip(ids, group_results))
+        return [results[message_id] for message_id in message_ids]
+
+    def _map_concurrently(self, function, items):
+        """Apply function to items on the worker threads, keeping the input order."""
+        if self._worker_pool() is None or len(items) <= 1:
+            return [function(item) for item in items]
+        return list(self.executor.map(function, items))
+
+    def _worker_pool(self):
+        """The shared worker pool, or None when called from one of its own threads (to avoid deadlock)."""
+        if self.executor is None or threading.current_thread().name.startswith(WORKER_THREAD_PREFIX):
+            return None
+        return self.executor
+
+    def _batch_fetcher(self):
+        """Batch fetcher that runs batches on the worker threads, each with its own service."""
+        executor = self._worker_pool()
+        return GmailBatchFetcher(lambda: self.service, max_workers=self.max_workers if executor else 1,
+                                 executor=executor)
+
+    def close(self):
+        """Send what the outbox still holds, stop it and the worker threads, and close the local stores."""
+        if self._closed:
+            return
+        self._closed = True
+        if self.outbox is not None:
+            if not self.outbox.flush(timeout=OUTBOX_EXIT_FLUSH_SECONDS):
+                logging.warning("Outbox not drained before exit; the rest is sent on the next start.")
+            self.outbox.close()
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+        if self.mirror is not None:
+            self.mirror.close()
+        if self.behavior_log is not None:
+            self.behavior_log.close()
+        self.behavior_store.close()
+
+    def triage_emails(self, message_ids):
+        """Two-phase triage: score on metadata, then fully process only mail that matters.
+
+        Phase one scores headers, labels and snippet (or the mirrored body when
+        available) fetched with format=metadata and a fields mask. Phase two
+        downloads full messages and summarizes threads only for Urgent and
+        Follow-up mail; the rest keeps a snippet-based summary.
+        """
+        messages = {}
+        if self.mirror is not None:
+            for message_id in message_ids:
+                mirrored = self.mirror.get_message(message_id)
+                if mirrored is not None:
+                    messages[message_id] = mirrored
+
+        messages.update(self._batch_fetcher().get_messages(
+            [i for i in message_ids if i not in messages],
+            format='metadata',
+            metadataHeaders=TRIAGE_METADATA_HEADERS,
+            fields=TRIAGE_METADATA_FIELDS
+        ))
+
+        # Phase one: prefilter bulk mail, then score the rest from metadata in one batch
+        scored_ids, email_data_list, prefiltered = [], [], {}
+        for message_id in message_ids:
+            message = messages.get(message_id)
+            if message is None:
+                continue
+            subject, sender, content = self._decode_message(message)
+            email_data = {
+                'subject': subject,
+                'content': content or message.get('snippet', ''),
+                'sender': sender,
+                'is_important': self.check_importance(message),
+                'thread_id': message.get('threadId'),
+                'message_id': message_id
+            }
+            reason = self._prefilter_reason(message, sender)
+            if reason is not None:
+                self.prefilter.record(reason)
+                email_data['prefilter_reason'] = reason
+                prefiltered[message_id] = email_data
+                continue
+            scored_ids.append(message_id)
+            email_data_list.append(email_data)
+        self._set_thread_lengths(email_data_list)
+        priorities = dict(zip(scored_ids, self.analyze_priority_batch(email_data_list)))
+        email_data_by_id = dict(zip(scored_ids, email_data_list))
+
+        # Phase two: full download and thread summary only where it pays off
+        full_ids = [i for i in scored_ids if priorities[i] in TRIAGE_FULL_PRIORITIES]
+        full_results = dict(zip(full_ids, self.process_emails_bulk(full_ids)))
+
+        # Cluster the metadata-only results among themselves and against analysed mail
+        batch_index = NearDuplicateIndex()
+        for message_id in scored_ids:
+            if message_id not in full_results:
+                self._mark_duplicate(email_data_by_id[message_id], batch_index)
+
+        results = []
+        for message_id in message_ids:
+            if message_id in full_results:
+                results.append(full_results[message_id])
+            elif message_id in prefiltered:
+                results.append(self._metadata_result(
+                    messages[message_id], prefiltered[message_id], "Low Priority", flag_reminder=False))
+            elif message_id in priorities:
+                results.append(self._metadata_result(
+                    messages[message_id], email_data_by_id[message_id], priorities[message_id]))
+            else:
+                # Neither mirrored nor fetched: fall back to the single-request path
+                results.append(self.process_new_email(message_id))
+        return results
+
+    def _set_thread_lengths(self, email_data_list):
+        """Fill in thread_length from the mirror, or from the batch itself, as training does."""
+        thread_ids = [email_data['thread_id'] for email_data in email_data_list]
+        sizes = Counter(thread_ids)
+        if self.mirror is not None:
+            for thread_id, size in self.mirror.thread_sizes(thread_ids).items():
+                sizes[thread_id] = max(sizes[thread_id], size)
+        for email_data in email_data_list:
+            email_data['thread_length'] = sizes[email_data['thread_id']] or 1
+
+    def _mark_duplicate(self, email_data, batch_index):
+        """Set email_data['duplicate_of'] if the email is a near-duplicate of analysed or batch mail."""
+        fingerprint = self.duplicate_index.fingerprint(f"{email_data['subject']} {email_data['content']}")
+        if fingerprint is None:
+            return
+        match = self.duplicate_index.find(fingerprint) or batch_index.find(fingerprint)
+        if match is not None and match[0] != email_data['message_id']:
+            email_data['duplicate_of'] = match[0]
+        else:
+            batch_index.add(email_data['message_id'], fingerprint, None)
+
+    def _prefilter_reason(self, message, sender=None):
+        """Return why a message can skip the models, or None.
+
+        Mail Gmail marks important and mail from senders the user usually
+        answers always gets the full analysis.
+        """
+        if self.check_importance(message):
+            return None
+        reason = self.prefilter.classify(message, sender)
+        if reason is not None and self.analyze_sender_history(sender or self._decode_sender(message)):
+            return None
+        return reason
+
+    @staticmethod
+    def _decode_sender(message):
+        if 'payload' not in message:
+            return message.get('sender', '')
+        return message_headers(message).get('from', '')
+
+    def _metadata_result(self, message, email_data, priority, flag_reminder=True):
+        """Build a triage result without downloading the body or summarizing the thread."""
+        snippet = message.get('snippet', '')
+        if flag_reminder and 'UNREAD' in message.get('labelIds', []):
+            reminder_time = datetime.now(timezone.utc) + timedelta(hours=5)
+            self.flag_email_for_reminder(email_data, reminder_time.isoformat())
+
+        return {
+            'priority': priority,
+            'thread_summary': {
+                'subject': email_data['subject'],
+                'participants': {email_data['sender']} if email_data['sender'] else set(),
+                'summary': snippet,
+                'key_points': [],
+                'latest_update': snippet,
+                'message_count': 0,
+                'summarized': False
+            },
+            'email_data': email_data
+        }
+
+    def _mirror_row(self, message):
+        """Build the decoded mirror record for a Gmail API message."""
+        subject, sender, content = self.extract_email_content(message)
+        return {
+            'id': message['id'],
+            'threadId': message.get('threadId'),
+            'historyId': message.get('historyId'),
+            'internalDate': message.get('internalDate'),
+            'labelIds': message.get('labelIds', []),
+            'snippet': message.get('snippet', ''),
+            'subject': subject,
+            'sender': sender,
+            'content': content,
+            'headers': {name: value for name, value in message_headers(message).items()
+                        if name in PREFILTER_HEADER_KEYS}
+        }
+
+    def sync_mailbox(self, max_threads=200):
+        """Bring the local mirror up to date, transferring only what changed."""
+        if self.mirror is None:
+            return 0
+        try:
+            start_history_id = self.mirror.get_history_id()
+            if start_history_id is None:
+                return self._full_mirror_sync(max_threads)
+            return self._incremental_mirror_sync(start_history_id)
+        except HttpError as e:
+            if getattr(e.resp, 'status', None) == 404:
+                # The stored historyId is too old for history.list
+                logging.warning("Mailbox mirror history expired, running a full sync.")
+                try:
+                    return self._full_mirror_sync(max_threads)
+                except Exception as full_sync_error:
+                    logging.error(f"Error running full mailbox sync: {str(full_sync_error)}")
+                    return 0
+            logging.error(f"Error syncing mailbox mirror: {str(e)}")
+            return 0
+        except Exception as e:
+            logging.error(f"Error syncing mailbox mirror: {str(e)}")
+            return 0
+
+    def _full_mirror_sync(self, max_threads):
+        """Mirror the most recent threads and record the current historyId."""
+        # Read the historyId first so changes made during the sync are replayed next time
+        profile = self.service.users().getProfile(userId='me').execute()
+        results = self.service.users().threads().list(
+            userId='me', maxResults=min(max_threads, 500)).execute()
+        thread_ids = [thread['id'] for thread in results.get('threads', [])]
+
+        threads = self._batch_fetcher().get_threads(thread_ids)
+        rows = [self._mirror_row(message)
+                for thread in threads.values() for message in thread.get('messages', [])]
+        self.mirror.upsert_messages(rows)
+        # Threads that could not be fetched are retried by the next incremental sync
+        pending = {'messages': {}, 'threads': {}}
+        self._track_pending_fetch(pending['threads'], thread_ids, threads)
+        self.mirror.set_pending_fetch(pending)
+        self.mirror.set_history_id(profile['historyId'])
+        logging.info(f"Mailbox mirror initialized with {len(rows)} messages.")
+        return len(rows)
+
+    def _incremental_mirror_sync(self, start_history_id):
+        """Replay history.list records since the last sync into the mirror."""
+        added, deleted, label_changes = set(), set(), []
+        latest_history_id = start_history_id
+        page_token = None
+
+        while True:
+            response = self.service.users().history().list(
+                userId='me',
+                startHistoryId=start_history_id,
+                historyTypes=['messageAdded', 'messageDeleted', 'labelAdded', 'labelRemoved'],
+                pageToken=page_token
+            ).execute()
+
+            for record in response.get('history', []):
+                for item in record.get('messagesAdded', []):
+                    added.add(item['message']['id'])
+                    deleted.discard(item['message']['id'])
+                for item in record.get('messagesDeleted', []):
+                    deleted.add(item['message']['id'])
+                    added.discard(item['message']['id'])
+                for item in record.get('labelsAdded', []):
+                    label_changes.append((item['message']['id'], record['id'], item.get('labelIds', []), []))
+                for item in record.get('labelsRemoved', []):
+                    label_changes.append((item['message']['id'], record['id'], [], item.get('labelIds', [])))
+
+            latest_history_id = response.get('historyId', latest_history_id)
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                break
+
+        # Messages and threads earlier syncs failed to fetch are retried with the new ones
+        pending = self.mirror.get_pending_fetch()
+        for message_id in deleted:
+            pending['messages'].pop(message_id, None)
+        added |= set(pending['messages'])
+        if added or pending['threads']:
+            fetcher = self._batch_fetcher()
+            new_messages = fetcher.get_messages(list(added))
+            # Threads the mirror has never seen are fetched whole so they stay complete
+            unknown_threads = {message.get('threadId') for message in new_messages.values()
+                               if not self.mirror.has_thread(message.get('threadId'))}
+            unknown_threads |= set(pending['threads'])
+            threads = fetcher.get_threads(list(unknown_threads))
+            rows = [self._mirror_row(message) for message in new_messages.values()]
+            rows.extend(self._mirror_row(message)
+                        for thread in threads.values() for message in thread.get('messages', []))
+            self.mirror.upsert_messages(rows)
+            self._track_pending_fetch(pending['messages'], added, new_messages)
+            self._track_pending_fetch(pending['threads'], unknown_threads, threads)
+            self.mirror.set_pending_fetch(pending)
+
+        for message_id, history_id, labels_added, labels_removed in label_changes:
+            if message_id not in added:
+                self.mirror.modify_labels(message_id, history_id, labels_added, labels_removed)
+        if deleted:
+            self.mirror.delete_messages(deleted)
+
+        self.mirror.set_history_id(latest_history_id)
+        return len(added) + len(deleted) + len(label_changes)
+
+    @staticmethod
+    def _track_pending_fetch(attempts, requested, fetched):
+        """Count failed fetches in attempts ({id: failures}); ids that keep failing are given up on."""
+        for item_id in requested:
+            if item_id in fetched:
+                attempts.pop(item_id, None)
+                continue
+            attempts[item_id] = attempts.get(item_id, 0) + 1
+            if attempts[item_id] >= MIRROR_FETCH_MAX_ATTEMPTS:
+                logging.error(f"Giving up mirroring {item_id} after {attempts[item_id]} failed fetches.")
+                del attempts[item_id]
+
     def generate_email_url(self, message_id):
         """Generate a URL to view the email in Gmail."""
         return f"https://mail.google.com/mail/u/0/#inbox/{message_id}"
@@ -389,33 +1201,9 @@ class GmailPriorityManager:
             if not sender:
                 return
 
-            behavior_data = {}
-            if os.path.exists(self.behavior_file):
-                with open(self.behavior_file, 'r') as f:
-                    behavior_data = json.load(f)
-
-            if sender not in behavior_data:
-                behavior_data[sender] = {
-                    'total_emails': 0,
-                    'responses': 0,
-                    'response_rate': 0.0,
-                    'last_interaction': None
-                }
-
-            sender_data = behavior_data[sender]
-            sender_data['total_emails'] += 1
-
-            if action_type == 'response_sent':
-                sender_data['responses'] += 1
-
-            sender_data['response_rate'] = (
-                sender_data['responses'] / sender_data['total_emails']
-            )
-            sender_data['last_interaction'] = datetime.now().isoformat()
-
-            with open(self.behavior_file, 'w') as f:
-                json.dump(behavior_data, f, indent=2)
-
+            self.behavior_store.record_interaction(sender, action_type)
+            if self.behavior_log is not None and email_data.get('message_id'):
+                self.behavior_log.record(email_data['message_id'], action_type)
         except Exception as e:
             logging.error(f"Error logging user behavior: {str(e)}")
 
@@ -458,7 +1246,7 @@ class GmailPriorityManager:
             raise
 
     def send_quick_response(self, email_data: dict, response_text: str) -> dict:
-        """Send a quick response to an email."""
+        """Queue a quick response to an email and return its outbox entry."""
         try:
             # Extract original email details
             original_sender = email_data.get('sender', '').split('<')[-1].strip('>')
@@ -471,25 +1259,90 @@ class GmailPriorityManager:
                 else original_subject
             )
 
-            # Send the response
-            sent_message = self.send_email(
-                to=original_sender,
-                subject=response_subject,
-                message_text=response_text,
-                thread_id=thread_id
-            )
-
-            # Log the response
-            self.log_user_behavior(email_data, 'response_sent')
+            reply = {
+                'to': original_sender,
+                'subject': response_subject,
+                'text': response_text,
+                'thread_id': thread_id,
+                'email_data': {
+                    'sender': email_data.get('sender', ''),
+                    'subject': original_subject,
+                    'thread_id': thread_id,
+                    'message_id': email_data.get('message_id')
+                }
+            }
+            if self.outbox is None:
+                sent = self._send_outbox_reply(reply)
+                self._after_reply_sent(reply, sent)
+                return {'id': sent.get('id'), 'status': 'sent', 'threadId': thread_id}
 
-            # Mark email as read after responding
-            self.mark_email_as_read(email_data)
+            # Queue the response; the outbox sends it, logs it and marks the email as read
+            outbox_id = self.outbox.enqueue_reply(reply)
+            logging.info(f"Response to {original_sender} queued (outbox id {outbox_id}).")
 
-            return sent_message
+            return {'outbox_id': outbox_id, 'status': 'queued', 'threadId': thread_id}
         except Exception as e:
             logging.error(f"Error sending quick response: {str(e)}")
             raise
 
+    def _send_outbox_reply(self, reply):
+        """Send a reply taken from the outbox."""
+        return self.send_email(
+            to=reply['to'],
+            subject=reply['subject'],
+            message_text=reply['text'],
+            thread_id=reply.get('thread_id')
+        )
+
+    def _after_reply_sent(self, reply, sent_message):
+        """Log the response and mark the original email as read once a reply went out."""
+        self.log_user_behavior(reply['email_data'], 'response_sent')
+        self.mark_email_as_read(reply['email_data'])
+        if self.reply_index is not None and sent_message:
+            try:
+                self.reply_index.add([{'id': sent_message['id'], 'text': reply['text'],
+                                       'subject': reply['subject']}])
+            except Exception as e:
+                logging.error(f"Error adding sent reply to the reply index: {str(e)}")
+
+    def build_reply_index(self, limit=None, stop_at_known=True):
+        """Embed sent replies into the reply index, newest first. Returns the number added.
+
+        With stop_at_known the scan ends at the first already-indexed batch, so
+        re-running it only picks up mail sent since the last build.
+        """
+        if self.reply_index is None:
+            return 0
+        added = 0
+        fetcher = self._batch_fetcher()
+        message_ids = self.iter_message_ids(label_ids=['SENT'], limit=limit)
+        try:
+            while True:
+                batch = [message_id for _, message_id in zip(range(REPLY_INDEX_BATCH_SIZE), message_ids)]
+                if not batch:
+                    break
+                new_ids = [message_id for message_id in batch if message_id not in self.reply_index]
+                if stop_at_known and not new_ids:
+                    break
+                replies = []
+                for message in fetcher.get_messages(new_ids).values():
+                    drop_attachment_data(message.get('payload', {}))
+                    subject, _, content = self.extract_email_content(message)
+                    # Only the text the user wrote, not the quoted message being answered
+                    replies.append({'id': message['id'], 'subject': subject,
+                                    'text': self.quote_stripper.strip(content)})
+                added += self.reply_index.add(replies)
+        finally:
+            message_ids.close()
+        return added
+
+    def _remove_unread_labels(self, message_ids):
+        """Remove the UNREAD label from many messages in one call."""
+        self.service.users().messages().batchModify(
+            userId='me',
+            body={'ids': message_ids, 'removeLabelIds': ['UNREAD']}
+        ).execute()
+
     def display_response_options(self, email_data):
         """Display quick response options for an email and allow selection."""
         try:
@@ -533,7 +1386,7 @@ class GmailPriorityManager:
                 custom_text = "\n".join(lines[:-1])  # Remove the last empty line
                 if custom_text.strip():
                     sent_message = self.send_quick_response(email_data, custom_text)
-                    print("Custom response sent successfully!")
+                    print("Custom response queued for sending.")
                     return sent_message
                 else:
                     print("Empty response. Canceled.")
@@ -542,7 +1395,7 @@ class GmailPriorityManager:
                 # Send selected response
                 selected = suggestions[choice-1]
                 sent_message = self.send_quick_response(email_data, selected['text'])
-                print(f"Response sent: {selected['type'].replace('_', ' ').title()}")
+                print(f"Response queued: {selected['type'].replace('_', ' ').title()}")
                 return sent_message
         
         except Exception as e:
@@ -553,32 +1406,19 @@ class GmailPriorityManager:
     def flag_email_for_reminder(self, email_data, reminder_time, reminder_type="default"):
         """Flag an email for reminder with a specified time."""
         try:
-            behavior_data = self._load_behavior_data()  # Load behavior data
             sender_email = email_data.get("sender")
             message_id = email_data.get("message_id")
 
-            if sender_email not in behavior_data:
-                behavior_data[sender_email] = {
-                    "total_emails": 0,
-                    "responses": 0,
-                    "response_rate": 0.0,
-                    "last_interaction": None,
-                    "reminders": {}
-                }
-
-            if "reminders" not in behavior_data[sender_email]:
-                behavior_data[sender_email]["reminders"] = {}
-
             # Add reminder information for the message_id
-            behavior_data[sender_email]["reminders"][message_id] = {
+            reminder = {
                 "flagged": True,
                 "status": "unanswered",
                 "reminder_time": reminder_time,  # Store the ISO formatted time
                 "reminder_type": reminder_type,  # "default" or "custom"
                 "subject": email_data.get("subject", "No Subject")
             }
-
-            self._save_behavior_data(behavior_data)  # Save behavior data
+            self.behavior_store.set_reminder(sender_email, message_id, reminder)
+            self.reminder_scheduler.schedule(message_id, dict(reminder, sender=sender_email))
             logging.info(f"Email {message_id} flagged for reminder at {reminder_time}.")
             
             return True
@@ -589,23 +1429,20 @@ class GmailPriorityManager:
     def mark_email_as_read(self, email_data):
         """Mark an email as read."""
         try:
-            # 1. Update in Gmail (modify labels)
+            # 1. Update in Gmail (queued and grouped into batchModify calls by the outbox)
             message_id = email_data.get("message_id")
             if message_id:
-                self.service.users().messages().modify(
-                    userId='me',
-                    id=message_id,
-                    body={'removeLabelIds': ['UNREAD']}
-                ).execute()
+                if self.outbox is not None:
+                    self.outbox.enqueue_mark_read(message_id)
+                else:
+                    self._remove_unread_labels([message_id])
+                if self.mirror is not None:
+                    self.mirror.modify_labels(message_id, None, removed=['UNREAD'])
             
             # 2. Update in our local tracking system
-            behavior_data = self._load_behavior_data()
-            sender_email = email_data.get("sender")
-            
-            if sender_email in behavior_data and "reminders" in behavior_data[sender_email] and \
-               message_id in behavior_data[sender_email]["reminders"]:
-                behavior_data[sender_email]["reminders"][message_id]["status"] = "read"
-                self._save_behavior_data(behavior_data)
+            if message_id:
+                self.behavior_store.update_reminder(message_id, status="read")
+                self.reminder_scheduler.cancel(message_id)
             
             logging.info(f"Email {message_id} marked as read.")
             return True
@@ -616,37 +1453,14 @@ class GmailPriorityManager:
     def check_reminders(self):
         """Check for reminders that are due and take action."""
         try:
-            behavior_data = self._load_behavior_data()
-            now = datetime.now(timezone.utc)
-            due_reminders = []
-
-            # First pass: collect all due reminders
-            for sender_email, sender_data in behavior_data.items():
-                if "reminders" not in sender_data:
-                    continue  # Skip senders without reminders
-
-                for message_id, reminder_data in sender_data["reminders"].items():
-                    if not reminder_data.get("flagged", False):  # Skip if not flagged
-                        continue
-                    
-                    if reminder_data.get("status", "") != "unanswered":  # Skip if already read
-                        continue
-                    
-                    try:
-                        reminder_time = datetime.fromisoformat(reminder_data["reminder_time"])
-                        if reminder_time.tzinfo is None:
-                            reminder_time = reminder_time.replace(tzinfo=timezone.utc)
-                    except ValueError as ve:
-                        logging.error(f"Error parsing reminder time for email {message_id}: {ve}")
-                        continue
-
-                    if now >= reminder_time:
-                        due_reminders.append({
-                            "sender_email": sender_email,
-                            "message_id": message_id,
-                            "subject": reminder_data.get("subject", "No Subject"),
-                            "reminder_time": reminder_time
-                        })
+            # First pass: collect all due reminders from the time-ordered index
+            self.behavior_store.refresh()
+            due_reminders = [{
+                "sender_email": reminder_data["sender"],
+                "message_id": reminder_data["message_id"],
+                "subject": reminder_data.get("subject") or "No Subject",
+                "reminder_time": reminder_data["reminder_time"]
+            } for reminder_data in self.reminder_scheduler.due_reminders()]
 
             # Second pass: handle all due reminders
             if due_reminders:
@@ -763,35 +1577,23 @@ class GmailPriorityManager:
                     print("Invalid date/time format. Please use YYYY-MM-DD for date and HH:MM for time.")
 
         # Update status in behavior data
-        behavior_data = self._load_behavior_data()
-        if sender_email in behavior_data and "reminders" in behavior_data[sender_email] and \
-            message_id in behavior_data[sender_email]["reminders"]:
-            
-            # If rescheduled (options 3,4,5), we've already updated. Otherwise, unflag.
-            if choice < 3:
-                behavior_data[sender_email]["reminders"][message_id]["flagged"] = False
-                self._save_behavior_data(behavior_data)
+        # If rescheduled (options 3,4,5), we've already updated. Otherwise, unflag.
+        if choice < 3:
+            self.behavior_store.update_reminder(message_id, flagged=False)
+            self.reminder_scheduler.cancel(message_id)
+
+    def _load_reminder_schedule(self):
+        """Index flagged, unanswered reminders from the behavior store."""
+        self.reminder_scheduler.load(
+            (message_id, reminder) for message_id, reminder in self.behavior_store.reminders()
+            if reminder.get("flagged") and reminder.get("status") == "unanswered"
+        )
 
-    def _load_behavior_data(self):
-        """Load user behavior data from file."""
-        try:
-            if not os.path.exists(self.behavior_file):
-                return {}
-            with open(self.behavior_file, 'r') as f:
-                return json.load(f)
-        except FileNotFoundError:
-            logging.warning(f"Behavior file {self.behavior_file} not found.")
-            return {}
-        except json.JSONDecodeError as e:
-            logging.error(f"JSON decode error in behavior file: {str(e)}")
-            return {}
-
-    def _save_behavior_data(self, data):
-        """Save user behavior data to file."""
-        try:
-            with open(self.behavior_file, 'w') as f:
-                json.dump(data, f, indent=2)
-            return True
-        except Exception as e:
-            logging.error(f"Error saving behavior data: {str(e)}")
-            return False
+    def start_reminder_thread(self, callback=None):
+        """Watch for due reminders in the background, sleeping until the next one is due."""
+        self.reminder_scheduler.start(callback or self._log_due_reminders)
+
+    def _log_due_reminders(self, reminders):
+        for reminder in reminders:
+            logging.info(f"Reminder due: '{reminder.get('subject') or 'No Subject'}' "
+                         f"from {reminder['sender']} (email {reminder['message_id']})")
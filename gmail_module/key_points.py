@@ -0,0 +1,101 @@
+import logging
+import threading
+import numpy as np
+import spacy
+
+# Each repeat of a keyword already counted in a sentence adds this much to its score
+REPEAT_WEIGHT = 0.25
+# Characters of a thread searched for key points
+MAX_KEY_POINT_CHARS = 2000
+
+
+class KeyPointExtractor:
+    """Pick the sentences of a text that carry the most urgency keywords.
+
+    Sentences are split by a blank English pipeline with only the rule-based
+    sentencizer (no tagger, parser or NER), run over many texts at once with
+    nlp.pipe. All sentences of a batch are then scanned together by the
+    KeywordMatcher and ranked with array operations: a sentence scores one
+    point per distinct keyword plus REPEAT_WEIGHT per repeat, and the best
+    `max_points` of each text are returned in their original order.
+    """
+
+    def __init__(self, keyword_matcher, max_points=3, max_chars=MAX_KEY_POINT_CHARS,
+                 batch_size=64, n_process=1):
+        self.keyword_matcher = keyword_matcher
+        self.max_points = max_points
+        self.max_chars = max_chars
+        self.batch_size = batch_size
+        # Worker processes for nlp.pipe; only worth it for large backlogs
+        self.n_process = n_process
+        self._lock = threading.Lock()
+        try:
+            self.nlp = spacy.blank("en")
+            self.nlp.add_pipe("sentencizer")
+        except Exception as e:
+            logging.error(f"Error creating the sentence splitter: {str(e)}")
+            self.nlp = None
+
+    def extract(self, text):
+        """Return the key-point sentences of one text."""
+        return self.extract_batch([text])[0]
+
+    def extract_batch(self, texts, n_process=None):
+        """Return the key-point sentences of every text, in one pass over the batch."""
+        texts = [(text or "")[:self.max_chars] for text in texts]
+        key_points = [[] for _ in texts]
+        if self.nlp is None or not texts:
+            return key_points
+
+        with self._lock:
+            docs = list(self.nlp.pipe(texts, batch_size=self.batch_size,
+                                      n_process=n_process or self.n_process))
+        sentences, owners = [], []
+        for index, doc in enumerate(docs):
+            for sent in doc.sents:
+                sentence = sent.text.strip()
+                if sentence:
+                    sentences.append(sentence)
+                    owners.append(index)
+        if not sentences:
+            return key_points
+
+        scores = self._score(sentences)
+        owners = np.asarray(owners)
+
+        candidates = np.flatnonzero(scores > 0)
+        if not len(candidates):
+            return key_points
+        # Group by text, best first; lexsort is stable, so ties keep sentence order
+        ranked = candidates[np.lexsort((-scores[candidates], owners[candidates]))]
+        groups = owners[ranked]
+        group_starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+        rank = np.arange(len(ranked)) - np.repeat(group_starts, np.diff(np.r_[group_starts, len(ranked)]))
+        for sentence_index in np.sort(ranked[rank < self.max_points]):
+            key_points[owners[sentence_index]].append(sentences[sentence_index])
+        return key_points
+
+    def merge(self, key_points, text):
+        """Rank earlier key points together with the sentences of new text.
+
+        On equal scores the newer sentence wins; the result keeps thread order.
+        """
+        sentences = list(key_points)
+        if self.nlp is not None and text:
+            with self._lock:
+                doc = self.nlp(text[:self.max_chars])
+            sentences += [sent.text.strip() for sent in doc.sents if sent.text.strip()]
+        if not sentences:
+            return []
+        scores = self._score(sentences)
+        # Best score first, later sentences first among equals
+        ranked = np.lexsort((-np.arange(len(sentences)), -scores))[:self.max_points]
+        return [sentences[index] for index in np.sort(ranked[scores[ranked] > 0])]
+
+    def _score(self, sentences):
+        """One point per distinct keyword of each sentence plus REPEAT_WEIGHT per repeat."""
+        features = self.keyword_matcher.scan_batch(sentences)
+        totals = np.fromiter((feature['total'] for feature in features), dtype=np.float64, count=len(features))
+        distinct = np.fromiter((len(feature['counts']) for feature in features), dtype=np.float64,
+                               count=len(features))
+        return distinct + REPEAT_WEIGHT * (totals - distinct)
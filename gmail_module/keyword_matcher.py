@@ -0,0 +1,65 @@
+import re
+from bisect import bisect_right
+
+
+class KeywordMatcher:
+    """Count keyword and multi-word phrase occurrences in plain text.
+
+    Each keyword is compiled once into a literal pattern (phrases match across
+    any run of whitespace). Texts are lowercased and joined, and each keyword
+    is searched over the whole batch at once; keywords whose first word does
+    not occur at all are skipped with a plain substring check. Matches must
+    sit on word boundaries, so "urgent" does not match "urgently".
+    """
+
+    def __init__(self, keywords):
+        self.keywords = sorted({" ".join(keyword.lower().split()) for keyword in keywords if keyword.strip()})
+        # Literal patterns keep the regex engine's fast prefix search, which a
+        # single alternation or a leading lookbehind would disable.
+        self._patterns = [
+            (keyword, keyword.split()[0],
+             re.compile(r"\s+".join(re.escape(word) for word in keyword.split())))
+            for keyword in self.keywords
+        ]
+
+    def count(self, text):
+        """Return {'total': n, 'counts': {keyword: n}} for one text."""
+        return self.scan_batch([text])[0]
+
+    def count_total(self, text):
+        """Return the total number of keyword matches in text."""
+        return self.scan_batch([text])[0]['total']
+
+    def scan_batch(self, texts):
+        """Scan many texts together and return per-text feature counts."""
+        features = [{'total': 0, 'counts': {}} for _ in texts]
+        if not texts:
+            return features
+
+        # Join with a separator that cannot be part of a match, then map each
+        # match back to its text through the start offsets.
+        lowered = [(text or "").lower() for text in texts]
+        starts, position = [], 0
+        for text in lowered:
+            starts.append(position)
+            position += len(text) + 1
+        joined = "\x00".join(lowered)
+        length = len(joined)
+
+        for keyword, first_word, pattern in self._patterns:
+            if first_word not in joined:
+                continue
+            for match in pattern.finditer(joined):
+                start, end = match.span()
+                if start > 0 and self._is_word_char(joined[start - 1]):
+                    continue
+                if end < length and self._is_word_char(joined[end]):
+                    continue
+                feature = features[bisect_right(starts, start) - 1]
+                feature['counts'][keyword] = feature['counts'].get(keyword, 0) + 1
+                feature['total'] += 1
+        return features
+
+    @staticmethod
+    def _is_word_char(char):
+        return char.isalnum() or char == "_"
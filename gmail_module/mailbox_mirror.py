@@ -0,0 +1,235 @@
+import json
+import time
+import sqlite3
+import threading
+
+
+class MailboxMirror:
+    """Local SQLite copy of message metadata and decoded bodies."""
+
+    def __init__(self, db_path="mailbox_mirror.db"):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self._create_tables()
+
+    def _create_tables(self):
+        with self._lock, self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS messages (
+                    id TEXT PRIMARY KEY,
+                    thread_id TEXT,
+                    history_id INTEGER,
+                    internal_date INTEGER,
+                    label_ids TEXT,
+                    snippet TEXT,
+                    subject TEXT,
+                    sender TEXT,
+                    content TEXT,
+                    headers TEXT
+                )
+            """)
+            columns = {row['name'] for row in self.conn.execute("PRAGMA table_info(messages)")}
+            if 'headers' not in columns:
+                # Mirrors created before prefilter headers were stored
+                self.conn.execute("ALTER TABLE messages ADD COLUMN headers TEXT")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_thread ON messages (thread_id)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_date ON messages (internal_date)")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS sync_state (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                )
+            """)
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS thread_summaries (
+                    thread_id TEXT PRIMARY KEY,
+                    message_ids TEXT,
+                    summary TEXT,
+                    key_points TEXT,
+                    incremental_updates INTEGER,
+                    updated_at REAL
+                )
+            """)
+
+    def get_history_id(self):
+        """Return the historyId the mirror was last synced to, or None."""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT value FROM sync_state WHERE key = 'history_id'").fetchone()
+        return row['value'] if row else None
+
+    def set_history_id(self, history_id):
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO sync_state (key, value) VALUES ('history_id', ?)",
+                (str(history_id),))
+
+    def get_pending_fetch(self):
+        """Return {'messages': {id: attempts}, 'threads': {id: attempts}} that a sync failed to fetch."""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT value FROM sync_state WHERE key = 'pending_fetch'").fetchone()
+        return json.loads(row['value']) if row else {'messages': {}, 'threads': {}}
+
+    def set_pending_fetch(self, pending):
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO sync_state (key, value) VALUES ('pending_fetch', ?)",
+                (json.dumps(pending),))
+
+    def upsert_messages(self, rows):
+        """Insert or replace decoded messages (dicts as built by GmailPriorityManager)."""
+        with self._lock, self.conn:
+            self.conn.executemany("""
+                INSERT OR REPLACE INTO messages
+                    (id, thread_id, history_id, internal_date, label_ids, snippet, subject, sender, content,
+                     headers)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, [(
+                row['id'],
+                row.get('threadId'),
+                int(row.get('historyId') or 0),
+                int(row.get('internalDate') or 0),
+                json.dumps(row.get('labelIds', [])),
+                row.get('snippet', ''),
+                row.get('subject', ''),
+                row.get('sender', ''),
+                row.get('content', ''),
+                json.dumps(row.get('headers', {}))
+            ) for row in rows])
+
+    def delete_messages(self, message_ids):
+        with self._lock, self.conn:
+            self.conn.executemany("DELETE FROM messages WHERE id = ?",
+                                  [(message_id,) for message_id in message_ids])
+
+    def modify_labels(self, message_id, history_id, added=(), removed=()):
+        """Apply a label delta from a history record to a mirrored message."""
+        with self._lock, self.conn:
+            row = self.conn.execute(
+                "SELECT label_ids FROM messages WHERE id = ?", (message_id,)).fetchone()
+            if row is None:
+                return False
+            labels = [label for label in json.loads(row['label_ids']) if label not in removed]
+            labels.extend(label for label in added if label not in labels)
+            self.conn.execute(
+                "UPDATE messages SET label_ids = ?, history_id = MAX(history_id, ?) WHERE id = ?",
+                (json.dumps(labels), int(history_id or 0), message_id))
+            return True
+
+    def get_message(self, message_id):
+        """Return a mirrored message, or None if it is not in the mirror."""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT * FROM messages WHERE id = ?", (message_id,)).fetchone()
+        return self._row_to_message(row) if row else None
+
+    def get_thread_messages(self, thread_id):
+        """Return the mirrored messages of a thread, oldest first."""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT * FROM messages WHERE thread_id = ? ORDER BY internal_date",
+                (thread_id,)).fetchall()
+        return [self._row_to_message(row) for row in rows]
+
+    def has_thread(self, thread_id):
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT 1 FROM messages WHERE thread_id = ? LIMIT 1", (thread_id,)).fetchone()
+        return row is not None
+
+    def recent_message_ids(self, limit=10, label_id=None):
+        """Return the ids of the most recent messages, optionally filtered by label."""
+        query = "SELECT id FROM messages"
+        params = []
+        if label_id:
+            # label_ids holds a JSON list, so match the quoted label name
+            query += " WHERE label_ids LIKE ?"
+            params.append(f'%"{label_id}"%')
+        query += " ORDER BY internal_date DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self.conn.execute(query, params).fetchall()
+        return [row['id'] for row in rows]
+
+    def iter_messages(self, batch_size=500):
+        """Yield every mirrored message, reading batch_size rows at a time."""
+        last_id = ''
+        while True:
+            with self._lock:
+                rows = self.conn.execute(
+                    "SELECT * FROM messages WHERE id > ? ORDER BY id LIMIT ?",
+                    (last_id, batch_size)).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield self._row_to_message(row)
+            last_id = rows[-1]['id']
+
+    def thread_sizes(self, thread_ids=None):
+        """Return a dict of thread id -> number of mirrored messages, for all threads or the given ones."""
+        if thread_ids is None:
+            with self._lock:
+                rows = self.conn.execute(
+                    "SELECT thread_id, COUNT(*) AS size FROM messages GROUP BY thread_id").fetchall()
+            return {row['thread_id']: row['size'] for row in rows}
+
+        thread_ids = list(set(thread_ids))
+        sizes = {}
+        # Stay under SQLite's bound parameter limit
+        for start in range(0, len(thread_ids), 500):
+            chunk = thread_ids[start:start + 500]
+            with self._lock:
+                rows = self.conn.execute(
+                    f"SELECT thread_id, COUNT(*) AS size FROM messages WHERE thread_id IN "
+                    f"({','.join('?' * len(chunk))}) GROUP BY thread_id", chunk).fetchall()
+            sizes.update((row['thread_id'], row['size']) for row in rows)
+        return sizes
+
+    def get_thread_summary(self, thread_id):
+        """Return the stored summary of a thread and the message ids it covers, or None."""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT * FROM thread_summaries WHERE thread_id = ?", (thread_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            'message_ids': json.loads(row['message_ids']),
+            'summary': row['summary'],
+            'key_points': json.loads(row['key_points']),
+            'incremental_updates': row['incremental_updates']
+        }
+
+    def save_thread_summary(self, thread_id, message_ids, summary, key_points, incremental_updates=0):
+        with self._lock, self.conn:
+            self.conn.execute("""
+                INSERT OR REPLACE INTO thread_summaries
+                    (thread_id, message_ids, summary, key_points, incremental_updates, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (thread_id, json.dumps(list(message_ids)), summary, json.dumps(key_points),
+                  incremental_updates, time.time()))
+
+    def message_count(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+
+    @staticmethod
+    def _row_to_message(row):
+        return {
+            'id': row['id'],
+            'threadId': row['thread_id'],
+            'historyId': str(row['history_id']),
+            'internalDate': str(row['internal_date']),
+            'labelIds': json.loads(row['label_ids']),
+            'snippet': row['snippet'],
+            'subject': row['subject'],
+            'sender': row['sender'],
+            'content': row['content'],
+            'headers': json.loads(row['headers'] or '{}')
+        }
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
@@ -0,0 +1,97 @@
+import re
+import html
+import base64
+import logging
+
+# Bodies are cut to this many decoded bytes before they reach the NLP models
+MAX_BODY_BYTES = 100 * 1024
+
+_DROP_BLOCKS = re.compile(r"<(script|style|head|title)\b.*?</\1\s*>", re.IGNORECASE | re.DOTALL)
+_COMMENTS = re.compile(r"<!--.*?-->", re.DOTALL)
+_LINE_BREAKS = re.compile(r"<(br|/p|/div|/tr|/li|/h[1-6]|/table|hr)\b[^>]*>", re.IGNORECASE)
+_TAGS = re.compile(r"<[^>]+>")
+_SPACES = re.compile(r"[ \t\r\f\v ]+")
+_BLANK_LINES = re.compile(r"\n\s*\n+")
+_CHARSET = re.compile(r"charset\s*=\s*\"?([\w.:-]+)", re.IGNORECASE)
+
+
+def iter_parts(payload):
+    """Yield every MIME part of a Gmail payload depth-first, in document order."""
+    stack = [payload]
+    while stack:
+        part = stack.pop()
+        yield part
+        stack.extend(reversed(part.get('parts', [])))
+
+
+def _part_headers(part):
+    return {header['name'].lower(): header['value'] for header in part.get('headers', [])}
+
+
+def is_attachment(part):
+    """Return True for parts that are attachments rather than message bodies."""
+    if part.get('filename'):
+        return True
+    disposition = _part_headers(part).get('content-disposition', '')
+    return disposition.lower().startswith('attachment')
+
+
+def find_body_part(payload):
+    """Return the best body part at any depth: text/plain first, then text/html."""
+    html_part = None
+    for part in iter_parts(payload):
+        mime_type = part.get('mimeType', '')
+        if not mime_type.startswith('text/') or is_attachment(part):
+            continue
+        if not part.get('body', {}).get('data'):
+            continue
+        if mime_type == 'text/plain':
+            return part
+        if mime_type == 'text/html' and html_part is None:
+            html_part = part
+    return html_part
+
+
+def decode_part(part, max_bytes=MAX_BODY_BYTES):
+    """Decode a part's base64url body, decoding at most max_bytes bytes."""
+    data = part.get('body', {}).get('data', '')
+    if not data:
+        return ""
+    try:
+        # Only decode the base64 prefix that covers max_bytes (4 chars -> 3 bytes)
+        if max_bytes is not None:
+            data = data[:-(-max_bytes // 3) * 4]
+        raw = base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))[:max_bytes]
+    except (ValueError, TypeError) as e:
+        logging.error(f"Error decoding content: {str(e)}")
+        return ""
+
+    match = _CHARSET.search(_part_headers(part).get('content-type', ''))
+    charset = match.group(1) if match else 'utf-8'
+    try:
+        return raw.decode(charset, errors='replace')
+    except LookupError:
+        return raw.decode('utf-8', errors='replace')
+
+
+def html_to_text(markup):
+    """Convert HTML to plain text with a handful of regular expressions."""
+    text = _DROP_BLOCKS.sub(" ", markup)
+    text = _COMMENTS.sub(" ", text)
+    text = _LINE_BREAKS.sub("\n", text)
+    text = _TAGS.sub(" ", text)
+    text = html.unescape(text)
+    text = _SPACES.sub(" ", text)
+    text = _BLANK_LINES.sub("\n\n", text)
+    return "\n".join(line.strip() for line in text.split("\n")).strip()
+
+
+def extract_body(payload, max_bytes=MAX_BODY_BYTES):
+    """Return the plain-text body of a Gmail payload, decoding only the chosen part."""
+    part = find_body_part(payload)
+    if part is None:
+        return ""
+    content = decode_part(part, max_bytes)
+    if part.get('mimeType') == 'text/html':
+        content = html_to_text(content)
+    return content
@@ -0,0 +1,138 @@
+import os
+import logging
+import itertools
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from .gmail_functions import GmailPriorityManager
+
+
+class MultiAccountManager:
+    """Several authorized Gmail accounts triaged on one shared worker pool.
+
+    Every account gets its own GmailPriorityManager with its own token,
+    behavior store, mirror and outbox under `<accounts_dir>/<name>/`. The NLP
+    models are loaded once per process by gmail_functions, so all accounts
+    share them. Work is split into per-account chunks and scheduled round-robin
+    with a per-account cap, so a large mailbox cannot starve the others.
+    """
+
+    def __init__(self, account_names=(), credentials_path="credentials.json", accounts_dir="accounts",
+                 max_workers=4, chunk_size=25):
+        self.credentials_path = credentials_path
+        self.accounts_dir = accounts_dir
+        self.max_workers = max_workers
+        self.chunk_size = chunk_size
+        self.accounts = {}
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gmail-accounts")
+        for name in account_names:
+            self.add_account(name)
+
+    def add_account(self, name, **overrides):
+        """Authorize an account (running the OAuth flow on first use) and return its manager."""
+        account_dir = os.path.join(self.accounts_dir, name)
+        os.makedirs(account_dir, exist_ok=True)
+        settings = {
+            'credentials_path': self.credentials_path,
+            'token_path': os.path.join(account_dir, "token.pickle"),
+            'behavior_file': os.path.join(account_dir, "user_behavior.json"),
+            'mirror_path': os.path.join(account_dir, "mailbox_mirror.db"),
+            'outbox_path': os.path.join(account_dir, "outbox.db"),
+            'attachment_cache_dir': os.path.join(account_dir, "attachment_cache"),
+            'reply_index_dir': os.path.join(account_dir, "reply_index"),
+            'behavior_log_dir': os.path.join(account_dir, "user_behavior_log"),
+            # Concurrency comes from the shared pool, not from per-account threads
+            'max_workers': 1
+        }
+        settings.update(overrides)
+        self.accounts[name] = GmailPriorityManager(**settings)
+        return self.accounts[name]
+
+    def __getitem__(self, name):
+        return self.accounts[name]
+
+    def sync_all(self):
+        """Sync every account's mirror on the shared pool. Returns a dict of name -> changes."""
+        sources = {name: iter([None]) for name in self.accounts}
+        return {name: result for name, _, result in self._run_fair(
+            sources, lambda name, _: self.accounts[name].sync_mailbox())}
+
+    def triage_all(self, query='is:unread', limit_per_account=None):
+        """Yield (account, message_id, result) for every matching message of every account."""
+        sources = {
+            name: self._chunks(manager.iter_message_ids(query=query, limit=limit_per_account))
+            for name, manager in self.accounts.items()
+        }
+        for name, chunk, results in self._run_fair(
+                sources, lambda name, chunk: self.accounts[name].triage_emails(chunk)):
+            for message_id, result in zip(chunk, results or []):
+                yield name, message_id, result
+
+    def check_reminders(self):
+        """Run the interactive reminder check of each account in turn."""
+        for name, manager in self.accounts.items():
+            print(f"\n----- Reminders for {name} -----")
+            manager.check_reminders()
+
+    def _chunks(self, iterator):
+        while True:
+            chunk = list(itertools.islice(iterator, self.chunk_size))
+            if not chunk:
+                return
+            yield chunk
+
+    def _run_fair(self, sources, task):
+        """Run task(name, item) for the items of each account's source, round-robin.
+
+        Each account may have at most ceil(max_workers / active accounts) tasks
+        in flight; results are yielded as (name, item, result) as they finish.
+        """
+        order = deque(sources)
+        in_flight = {}
+        per_account = Counter()
+
+        while order or in_flight:
+            while len(in_flight) < self.max_workers and self._submit_next(
+                    sources, order, in_flight, per_account, task):
+                pass
+            if not in_flight:
+                continue
+
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name, item = in_flight.pop(future)
+                per_account[name] -= 1
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logging.error(f"Error processing account {name}: {str(e)}")
+                    result = None
+                yield name, item, result
+
+    def _submit_next(self, sources, order, in_flight, per_account, task):
+        """Submit the next item of the next eligible account. Returns False if nothing was submitted."""
+        if not order:
+            return False
+        cap = -(-self.max_workers // len(order))
+        for _ in range(len(order)):
+            name = order.popleft()
+            if per_account[name] >= cap:
+                order.append(name)
+                continue
+            try:
+                item = next(sources[name])
+            except StopIteration:
+                # Account has no more work: drop it from the rotation
+                continue
+            except Exception as e:
+                logging.error(f"Error listing work for account {name}: {str(e)}")
+                continue
+            order.append(name)
+            in_flight[self.executor.submit(task, name, item)] = (name, item)
+            per_account[name] += 1
+            return True
+        return False
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        for manager in self.accounts.values():
+            manager.close()
@@ -0,0 +1,105 @@
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+
+_URLS = re.compile(r"https?://\S+|www\.\S+")
+_EMAILS = re.compile(r"\S+@\S+")
+# Build numbers, timestamps, ids, amounts: anything with a digit varies between alerts
+_WITH_DIGITS = re.compile(r"\b\w*\d\w*\b")
+_WORDS = re.compile(r"\w+")
+
+FINGERPRINT_BITS = 64
+# Only the start of a body is fingerprinted
+MAX_FINGERPRINT_CHARS = 5000
+# Bodies shorter than this many words ("Thanks!") are too generic to deduplicate
+MIN_FINGERPRINT_WORDS = 20
+
+
+def normalize(text):
+    """Lower-case words of text with URLs, addresses and numbers replaced by placeholders."""
+    text = text[:MAX_FINGERPRINT_CHARS].lower()
+    text = _URLS.sub(" url ", text)
+    text = _EMAILS.sub(" email ", text)
+    text = _WITH_DIGITS.sub(" num ", text)
+    return _WORDS.findall(text)
+
+
+def simhash(words, shingle_size=3):
+    """64-bit SimHash of the word shingles of a normalized text."""
+    shingles = {" ".join(words[i:i + shingle_size])
+                for i in range(max(1, len(words) - shingle_size + 1))}
+    bits = [format(int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest(), 'big'), '064b')
+            for shingle in shingles]
+    # Count the 1s of every bit position at once by transposing the bit strings
+    majority = len(bits) / 2
+    return int("".join('1' if column.count('1') > majority else '0' for column in map("".join, zip(*bits))), 2)
+
+
+class NearDuplicateIndex:
+    """SimHash index that finds analysed emails within a small Hamming distance.
+
+    Fingerprints are split into `bands` equal bit ranges and indexed per band.
+    With max_distance < bands, two fingerprints within the distance always
+    share at least one identical band, so a lookup only compares the
+    candidates in the matching band buckets. Least recently used entries are
+    evicted beyond max_entries.
+    """
+
+    def __init__(self, max_distance=3, bands=4, max_entries=10000):
+        self.max_distance = max_distance
+        self.bands = bands
+        self.band_bits = FINGERPRINT_BITS // bands
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (fingerprint, value)
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def fingerprint(text):
+        """Return the SimHash of text, or None if it is too short to compare."""
+        words = normalize(text)
+        if len(words) < MIN_FINGERPRINT_WORDS:
+            return None
+        return simhash(words)
+
+    def _band_keys(self, fingerprint):
+        mask = (1 << self.band_bits) - 1
+        return [(band, (fingerprint >> (band * self.band_bits)) & mask) for band in range(self.bands)]
+
+    def find(self, fingerprint):
+        """Return (key, value) of the closest indexed entry within max_distance, or None."""
+        with self._lock:
+            best, best_distance = None, self.max_distance + 1
+            for band_key in self._band_keys(fingerprint):
+                for key in self._buckets.get(band_key, ()):
+                    distance = bin(self._entries[key][0] ^ fingerprint).count('1')
+                    if distance < best_distance:
+                        best, best_distance = key, distance
+            if best is None:
+                return None
+            self._entries.move_to_end(best)
+            return best, self._entries[best][1]
+
+    def add(self, key, fingerprint, value):
+        """Index a fingerprint under key with an arbitrary value."""
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (fingerprint, value)
+            for band_key in self._band_keys(fingerprint):
+                self._buckets.setdefault(band_key, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        fingerprint, _ = self._entries.pop(key)
+        for band_key in self._band_keys(fingerprint):
+            bucket = self._buckets.get(band_key)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band_key]
+
+    def __len__(self):
+        return len(self._entries)
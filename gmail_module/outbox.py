@@ -0,0 +1,284 @@
+import json
+import time
+import random
+import sqlite3
+import logging
+import threading
+from googleapiclient.errors import HttpError
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+# users.messages.batchModify accepts at most 1000 ids per call
+MAX_MODIFY_BATCH = 1000
+# A claimed reply that is not marked sent or failed within this many seconds is
+# assumed to belong to a crashed worker and may be claimed again
+SEND_LEASE_SECONDS = 300
+# Longest wait between retries of a failing UNREAD removal
+MAX_LABEL_BACKOFF_SECONDS = 300
+
+
+class Outbox:
+    """Persistent background queue for outgoing replies and UNREAD label removals.
+
+    Replies are stored in SQLite and sent by a worker thread, so callers return
+    immediately and pending sends survive a restart. Before sending, a worker
+    claims the row by moving it to 'sending' with a lease, so several Outbox
+    instances on one database never send the same reply twice; a lease that
+    expires is claimed again. Transient failures are retried with exponential
+    backoff. Message ids to mark as read are collected
+    and removed with users.messages.batchModify in groups of up to 1000.
+
+    `send` takes a queued reply dict and returns the sent message,
+    `remove_unread` takes a list of message ids, and `on_sent(reply, sent)`
+    runs after each successful send.
+    """
+
+    def __init__(self, send, remove_unread, on_sent=None, db_path="outbox.db",
+                 max_attempts=5, backoff_seconds=2.0, label_flush_interval=5.0,
+                 lease_seconds=SEND_LEASE_SECONDS):
+        self._send = send
+        self._remove_unread = remove_unread
+        self._on_sent = on_sent
+        self.db_path = db_path
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.label_flush_interval = label_flush_interval
+        self.lease_seconds = lease_seconds
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self._create_tables()
+
+        self._stopped = False
+        self._flush_labels_now = False
+        self._label_failures = 0
+        self._thread = threading.Thread(target=self._run, name="gmail-outbox", daemon=True)
+        self._thread.start()
+
+    def _create_tables(self):
+        with self._lock, self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    reply TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt REAL NOT NULL,
+                    last_error TEXT,
+                    sent_id TEXT,
+                    lease_until REAL
+                )
+            """)
+            columns = {row['name'] for row in self.conn.execute("PRAGMA table_info(outbox)")}
+            if 'lease_until' not in columns:
+                self.conn.execute("ALTER TABLE outbox ADD COLUMN lease_until REAL")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (status, next_attempt)")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS pending_mark_read (
+                    message_id TEXT PRIMARY KEY,
+                    queued_at REAL NOT NULL
+                )
+            """)
+
+    def enqueue_reply(self, reply):
+        """Queue a reply dict (to, subject, text, thread_id, email_data) and return its outbox id."""
+        with self._lock, self.conn:
+            cursor = self.conn.execute(
+                "INSERT INTO outbox (reply, next_attempt) VALUES (?, ?)",
+                (json.dumps(reply), time.time()))
+            outbox_id = cursor.lastrowid
+        self._notify()
+        return outbox_id
+
+    def enqueue_mark_read(self, message_id):
+        """Queue the removal of the UNREAD label from a message."""
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO pending_mark_read (message_id, queued_at) VALUES (?, ?)",
+                (message_id, time.time()))
+        self._notify()
+
+    def status(self, outbox_id):
+        """Return the status row of a queued reply as a dict, or None."""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT id, status, attempts, last_error, sent_id FROM outbox WHERE id = ?",
+                (outbox_id,)).fetchone()
+        return dict(row) if row else None
+
+    def pending_count(self):
+        """Return the number of unsent replies and queued label removals."""
+        with self._lock:
+            replies = self.conn.execute(
+                "SELECT COUNT(*) FROM outbox WHERE status IN ('pending', 'sending')").fetchone()[0]
+            labels = self.conn.execute("SELECT COUNT(*) FROM pending_mark_read").fetchone()[0]
+        return replies + labels
+
+    def flush(self, timeout=30.0):
+        """Wait until everything queued has been processed. Returns True if drained."""
+        deadline = time.monotonic() + timeout
+        with self._wakeup:
+            self._flush_labels_now = True
+            self._wakeup.notify_all()
+        while time.monotonic() < deadline:
+            if self.pending_count() == 0:
+                return True
+            time.sleep(0.1)
+        return False
+
+    def _notify(self):
+        with self._wakeup:
+            self._wakeup.notify_all()
+
+    def _run(self):
+        while not self._stopped:
+            try:
+                next_due = self._send_due_replies()
+                label_due = self._flush_mark_read()
+            except Exception as e:
+                logging.error(f"Error in outbox worker: {str(e)}")
+                next_due, label_due = time.time() + self.backoff_seconds, None
+
+            wake_at = min(t for t in (next_due, label_due, time.time() + 60) if t is not None)
+            with self._wakeup:
+                if not self._stopped and not self._flush_labels_now:
+                    self._wakeup.wait(max(0.0, wake_at - time.time()))
+
+    def _send_due_replies(self):
+        """Send every reply that is due. Returns when the next retry is due, or None."""
+        while True:
+            with self._lock:
+                row = self.conn.execute("""
+                    SELECT *, CASE status WHEN 'pending' THEN next_attempt ELSE lease_until END AS due
+                    FROM outbox WHERE status IN ('pending', 'sending')
+                    ORDER BY due LIMIT 1
+                """).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            if row['due'] > now:
+                return row['due']
+            if not self._claim(row, now):
+                # Another worker claimed it first
+                continue
+
+            reply = json.loads(row['reply'])
+            try:
+                sent = self._send(reply)
+            except Exception as e:
+                self._record_failure(row, e)
+                continue
+
+            with self._lock, self.conn:
+                self.conn.execute(
+                    "UPDATE outbox SET status = 'sent', attempts = attempts + 1, sent_id = ?, lease_until = NULL "
+                    "WHERE id = ?",
+                    (sent.get('id'), row['id']))
+            if self._on_sent is not None:
+                try:
+                    self._on_sent(reply, sent)
+                except Exception as e:
+                    logging.error(f"Error after sending outbox reply {row['id']}: {str(e)}")
+
+    def _claim(self, row, now):
+        """Atomically move a due row to 'sending' under a lease. Returns False if it was taken."""
+        with self._lock, self.conn:
+            cursor = self.conn.execute("""
+                UPDATE outbox SET status = 'sending', lease_until = ?
+                WHERE id = ? AND (status = 'pending' OR (status = 'sending' AND lease_until <= ?))
+            """, (now + self.lease_seconds, row['id'], now))
+        return cursor.rowcount == 1
+
+    def _record_failure(self, row, error):
+        attempts = row['attempts'] + 1
+        retryable = self._is_retryable(error)
+        if retryable and attempts < self.max_attempts:
+            delay = self.backoff_seconds * (2 ** (attempts - 1)) * random.uniform(0.8, 1.2)
+            status, next_attempt = 'pending', time.time() + delay
+            logging.warning(f"Outbox reply {row['id']} failed ({str(error)}), retrying in {delay:.1f}s.")
+        else:
+            status, next_attempt = 'failed', row['next_attempt']
+            logging.error(f"Outbox reply {row['id']} failed permanently: {str(error)}")
+        with self._lock, self.conn:
+            self.conn.execute(
+                "UPDATE outbox SET status = ?, attempts = ?, next_attempt = ?, last_error = ?, lease_until = NULL "
+                "WHERE id = ?",
+                (status, attempts, next_attempt, str(error), row['id']))
+
+    def _flush_mark_read(self):
+        """Remove UNREAD in batchModify groups. Returns when the next flush is due, or None."""
+        with self._lock:
+            oldest = self.conn.execute("SELECT MIN(queued_at) FROM pending_mark_read").fetchone()[0]
+        if oldest is None:
+            self._flush_labels_now = False
+            return None
+        flush_at = oldest + self.label_flush_interval
+        if flush_at > time.time() and not self._flush_labels_now:
+            return flush_at
+
+        while True:
+            with self._lock:
+                message_ids = [row['message_id'] for row in self.conn.execute(
+                    "SELECT message_id FROM pending_mark_read ORDER BY queued_at LIMIT ?",
+                    (MAX_MODIFY_BATCH,))]
+            if not message_ids:
+                self._flush_labels_now = False
+                return None
+            try:
+                self._remove_unread(message_ids)
+            except Exception as e:
+                if self._is_retryable(e):
+                    self._label_failures += 1
+                    delay = min(self.backoff_seconds * (2 ** (self._label_failures - 1)), MAX_LABEL_BACKOFF_SECONDS)
+                    logging.warning(f"Error removing UNREAD labels ({str(e)}), retrying in {delay:.1f}s.")
+                    self._flush_labels_now = False
+                    return time.time() + delay
+                # A permanent error (e.g. one invalid id fails the whole call): retry the ids
+                # one by one so the valid ones go through and only the bad ones are dropped
+                logging.error(f"Error removing UNREAD labels: {str(e)}")
+                message_ids = self._remove_unread_individually(message_ids)
+                if message_ids is None:
+                    self._flush_labels_now = False
+                    return time.time() + self.backoff_seconds
+            self._label_failures = 0
+            with self._lock, self.conn:
+                self.conn.executemany("DELETE FROM pending_mark_read WHERE message_id = ?",
+                                      [(message_id,) for message_id in message_ids])
+
+    def _remove_unread_individually(self, message_ids):
+        """Remove UNREAD one id at a time, dropping ids that fail permanently.
+
+        Returns the ids that are done with (removed or dropped), or None if a
+        transient error interrupted the pass.
+        """
+        done = []
+        for message_id in message_ids:
+            try:
+                self._remove_unread([message_id])
+            except Exception as e:
+                if self._is_retryable(e):
+                    with self._lock, self.conn:
+                        self.conn.executemany("DELETE FROM pending_mark_read WHERE message_id = ?",
+                                              [(done_id,) for done_id in done])
+                    return None
+                logging.error(f"Dropping UNREAD removal for {message_id}: {str(e)}")
+            done.append(message_id)
+        return done
+
+    @staticmethod
+    def _is_retryable(error):
+        if isinstance(error, HttpError):
+            return getattr(error.resp, 'status', None) in RETRYABLE_STATUSES
+        return isinstance(error, (OSError, TimeoutError))
+
+    def close(self, timeout=10.0):
+        """Stop the worker, letting a send in progress finish, and close the database."""
+        with self._wakeup:
+            self._stopped = True
+            self._wakeup.notify_all()
+        self._thread.join(timeout)
+        if not self._thread.is_alive():
+            with self._lock:
+                self.conn.close()
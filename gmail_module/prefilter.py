@@ -0,0 +1,71 @@
+import re
+import threading
+from collections import Counter
+
+# Headers the prefilter looks at; requested in metadata fetches and kept in the mirror
+PREFILTER_HEADERS = ['List-Unsubscribe', 'List-Id', 'Precedence', 'Auto-Submitted']
+# Gmail categories whose mail is never worth a model call
+BULK_CATEGORIES = {
+    'CATEGORY_PROMOTIONS': 'promotions',
+    'CATEGORY_SOCIAL': 'social',
+    'CATEGORY_FORUMS': 'forums'
+}
+_BULK_PRECEDENCE = {'bulk', 'list', 'junk'}
+_NOREPLY_SENDER = re.compile(
+    r"\b(no[-_.]?reply|do[-_.]?not[-_.]?reply|notifications?|mailer-daemon|bounces?)[^@\s<]*@",
+    re.IGNORECASE)
+
+
+def message_headers(message):
+    """Return the prefilter headers of a Gmail API or mirrored message, keyed by lower-case name."""
+    if 'payload' in message:
+        headers = message['payload'].get('headers', [])
+        return {header['name'].lower(): header['value'] for header in headers}
+    return {name.lower(): value for name, value in (message.get('headers') or {}).items()}
+
+
+class MailPrefilter:
+    """Rule-based bulk/promotional mail detection on labels and headers only.
+
+    `classify` returns the reason a message can skip the NLP models, or None.
+    Rules run cheapest first: Gmail category labels, then mailing-list and
+    auto-generated headers, then no-reply sender addresses. Skipped messages
+    are counted per reason through `record`.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = Counter()
+
+    def classify(self, message, sender=None):
+        """Return the prefilter reason for a message, or None if it needs full analysis."""
+        for label in message.get('labelIds', []):
+            if label in BULK_CATEGORIES:
+                return f"category:{BULK_CATEGORIES[label]}"
+
+        headers = message_headers(message)
+        if headers.get('list-unsubscribe'):
+            return "header:list-unsubscribe"
+        if headers.get('list-id'):
+            return "header:list-id"
+        precedence = headers.get('precedence', '').strip().lower()
+        if precedence in _BULK_PRECEDENCE:
+            return f"header:precedence-{precedence}"
+        auto_submitted = headers.get('auto-submitted', '').strip().lower()
+        if auto_submitted and auto_submitted != 'no':
+            return "header:auto-submitted"
+
+        if sender is None:
+            sender = headers.get('from', message.get('sender', ''))
+        if sender and _NOREPLY_SENDER.search(sender):
+            return "sender:noreply"
+        return None
+
+    def record(self, reason):
+        with self._lock:
+            self.counts[reason] += 1
+
+    def stats(self):
+        """Return the number of skipped messages per reason."""
+        with self._lock:
+            return dict(self.counts)
@@ -0,0 +1,108 @@
+import os
+import json
+import logging
+import numpy as np
+
+FEATURE_NAMES = [
+    'urgent_word_count',
+    'is_important',
+    'sender_responsive',
+    'sender_response_rate',
+    'negative_sentiment',
+    'thread_length'
+]
+PRIORITY_LABELS = np.array(["Low Priority", "Follow-up", "Urgent"])
+# The original hand-tuned rule: 2 per urgent keyword, 3 for IMPORTANT, 2 for a responsive sender
+DEFAULT_WEIGHTS = [2.0, 3.0, 2.0, 0.0, 0.0, 0.0]
+DEFAULT_THRESHOLDS = {'urgent': 6.0, 'follow_up': 3.0}
+
+
+class PriorityModel:
+    """Linear priority model scored over a whole feature matrix at once.
+
+    The score is X @ weights + bias; scores at or above the 'urgent' and
+    'follow_up' thresholds map to Urgent and Follow-up. Without a trained
+    weights file the defaults reproduce the original hand-weighted rule.
+    """
+
+    def __init__(self, weights=None, bias=0.0, thresholds=None, metadata=None):
+        self.weights = np.asarray(weights if weights is not None else DEFAULT_WEIGHTS, dtype=np.float64)
+        self.bias = float(bias)
+        self.thresholds = dict(thresholds or DEFAULT_THRESHOLDS)
+        self.metadata = metadata or {}
+
+    @classmethod
+    def load(cls, path):
+        """Load trained weights from JSON, falling back to the default rule."""
+        if not path or not os.path.exists(path):
+            return cls()
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            if data.get('feature_names') != FEATURE_NAMES:
+                logging.error(f"Priority weights in {path} use different features; using defaults.")
+                return cls()
+            return cls(data['weights'], data['bias'], data['thresholds'], data.get('metadata'))
+        except Exception as e:
+            logging.error(f"Error loading priority weights from {path}: {str(e)}")
+            return cls()
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump({
+                'feature_names': FEATURE_NAMES,
+                'weights': self.weights.tolist(),
+                'bias': self.bias,
+                'thresholds': self.thresholds,
+                'metadata': self.metadata
+            }, f, indent=2)
+
+    def uses(self, feature_name):
+        """Return True if the feature has a non-zero weight (so it is worth computing)."""
+        return bool(self.weights[FEATURE_NAMES.index(feature_name)])
+
+    def score(self, features):
+        return features @ self.weights + self.bias
+
+    def classify(self, features):
+        """Return the priority label of every row of the feature matrix."""
+        scores = self.score(features)
+        levels = ((scores >= self.thresholds['follow_up']).astype(np.int8) +
+                  (scores >= self.thresholds['urgent']).astype(np.int8))
+        return PRIORITY_LABELS[levels].tolist()
+
+    @classmethod
+    def train(cls, features, labels, epochs=500, learning_rate=0.1, l2=0.01,
+              urgent_probability=0.5, follow_up_probability=0.2):
+        """Fit a logistic regression on (features, 0/1 labels) with batch gradient descent.
+
+        Features are standardized for training and the weights folded back so
+        the model scores raw features. Positives are re-weighted to balance the
+        classes; thresholds are the logits of the given probabilities.
+        """
+        features = np.asarray(features, dtype=np.float64)
+        labels = np.asarray(labels, dtype=np.float64)
+        mean = features.mean(axis=0)
+        std = features.std(axis=0)
+        std[std < 1e-9] = 1.0
+        scaled = (features - mean) / std
+
+        positives = labels.sum()
+        sample_weights = np.where(labels == 1, len(labels) / (2 * max(positives, 1)),
+                                  len(labels) / (2 * max(len(labels) - positives, 1)))
+        weights = np.zeros(features.shape[1])
+        bias = 0.0
+        for _ in range(epochs):
+            predictions = 1.0 / (1.0 + np.exp(-(scaled @ weights + bias)))
+            error = (predictions - labels) * sample_weights
+            weights -= learning_rate * (scaled.T @ error / len(labels) + l2 * weights)
+            bias -= learning_rate * error.mean()
+
+        raw_weights = weights / std
+        # Features that carried no signal get an exact zero, so scoring can skip them
+        raw_weights[np.abs(raw_weights) < 1e-6] = 0.0
+        raw_bias = bias - float((weights * mean / std).sum())
+        logit = lambda probability: float(np.log(probability / (1 - probability)))
+        return cls(raw_weights, raw_bias,
+                   {'urgent': logit(urgent_probability), 'follow_up': logit(follow_up_probability)},
+                   {'samples': int(len(labels)), 'positives': int(positives)})
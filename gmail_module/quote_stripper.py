@@ -0,0 +1,177 @@
+import re
+import threading
+
+# "On Mon, 3 Jun 2024 at 10:00, Jane <jane@example.com> wrote:" (clients wrap it over up to 3 lines)
+_REPLY_HEADER = re.compile(r"^\s*(On\b.{0,300}\bwrote|Le\b.{0,300}\ba écrit|Am\b.{0,300}\bschrieb)\s*:\s*$",
+                           re.IGNORECASE)
+# A real reply header carries an email address, a time or a date; prose like
+# "On balance, I think Sam wrote:" does not
+_HEADER_DETAIL = re.compile(
+    r"[\w.+-]+@[\w-]+\.[\w.-]+"
+    r"|\b\d{1,2}:\d{2}\b"
+    r"|\b\d{1,4}[/.-]\d{1,2}[/.-]\d{1,4}\b"
+    r"|\b(19|20)\d{2}\b"
+    r"|\b\d{1,2}\.?\s+(Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\b"
+    r"|\b(Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\.?\s+\d{1,2}\b",
+    re.IGNORECASE)
+_QUOTED_LINE = re.compile(r"^\s*>")
+# The conventional signature separator is exactly "-- " on a line of its own
+_SIGNATURE_MARKER = re.compile(r"^-- \r?$")
+# Everything after these standalone lines is a previous message or a mobile footer
+_CUT_MARKERS = re.compile(
+    r"^\s*(-{2,}\s*Original Message\s*-{2,}"
+    r"|_{10,}"
+    r"|Sent from my (iPhone|iPad|Android|BlackBerry|mobile( device| phone)?|phone|smartphone|tablet"
+    r"|Samsung( Galaxy)?( \w+)?|Galaxy( \w+)?|Huawei( \w+)?|Pixel( \d+)?)"
+    r"|Sent from (Mail|Outlook|Yahoo Mail|Gmail) for (iOS|Android|iPhone|iPad|Windows( 10| 11)?)"
+    r"|Get Outlook for (iOS|Android))[.!]?\s*$",
+    re.IGNORECASE)
+# Start of a legal footer; only cut when it opens the message's trailing block
+_DISCLAIMER = re.compile(
+    r"^\s*((CONFIDENTIALITY NOTICE|DISCLAIMER)\b"
+    r"|This (e-?mail|message) and any attachments? .*(confidential|intended))",
+    re.IGNORECASE)
+# Non-blank lines a trailing disclaimer block may span
+DISCLAIMER_MAX_LINES = 12
+# Outlook-style quoted header block: "From:", "Sent:"/"Date:", "To:", "Cc:", "Subject:" lines
+_HEADER_FIELD = re.compile(r"^\s*\*?(From|Sent|Date|To|Cc|Subject):\*?\s", re.IGNORECASE)
+_TOKENS = re.compile(r"\S+")
+_BLANK_LINES = re.compile(r"\n\s*\n")
+
+
+class QuoteStripper:
+    """Remove quoted reply chains, signatures and disclaimers from email bodies.
+
+    Keeps running whitespace-token counts of the text it was given and the text
+    it returned, so the saving is visible through `tokens_saved`.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.tokens_in = 0
+        self.tokens_out = 0
+
+    @property
+    def tokens_saved(self):
+        return self.tokens_in - self.tokens_out
+
+    def stats(self):
+        """Return the token counters as a dict."""
+        with self._lock:
+            saved = self.tokens_in - self.tokens_out
+            return {
+                'tokens_in': self.tokens_in,
+                'tokens_out': self.tokens_out,
+                'tokens_saved': saved,
+                'saved_ratio': saved / self.tokens_in if self.tokens_in else 0.0
+            }
+
+    def strip(self, text):
+        """Return the new content of a single email body."""
+        stripped = self._strip(text)
+        self._count(text, stripped)
+        return stripped
+
+    def strip_thread(self, contents):
+        """Strip every message of a thread, also dropping trailing blocks repeated across messages."""
+        stripped = [self._strip(content) for content in contents]
+        stripped = self._drop_repeated_trailers(stripped)
+        for content, result in zip(contents, stripped):
+            self._count(content, result)
+        return stripped
+
+    def _count(self, original, stripped):
+        tokens_in = len(_TOKENS.findall(original))
+        tokens_out = len(_TOKENS.findall(stripped))
+        with self._lock:
+            self.tokens_in += tokens_in
+            self.tokens_out += tokens_out
+
+    def _strip(self, text):
+        lines = text.split("\n")
+        kept = []
+        i = 0
+        while i < len(lines):
+            line = lines[i]
+            if _QUOTED_LINE.match(line):
+                i += 1
+                continue
+            if _CUT_MARKERS.match(line) or _SIGNATURE_MARKER.match(line):
+                break
+            if _DISCLAIMER.match(line) and self._is_trailing_block(lines, i):
+                break
+            if self._is_quoted_header_block(lines, i):
+                break
+
+            header_end = self._reply_header_end(lines, i)
+            if header_end is not None:
+                following = next((nxt for nxt in lines[header_end:] if nxt.strip()), "")
+                if not _QUOTED_LINE.match(following):
+                    # Quote without ">" prefixes (e.g. converted HTML): the rest is the old chain
+                    break
+                i = header_end
+                continue
+
+            kept.append(line)
+            i += 1
+
+        return "\n".join(kept).strip()
+
+    def _is_trailing_block(self, lines, start):
+        """True if lines from start run to the end, or to quoted history, as one short block."""
+        if start > 0 and lines[start - 1].strip():
+            # A footer starts its own paragraph
+            return False
+        block = 0
+        for i in range(start, len(lines)):
+            if _QUOTED_LINE.match(lines[i]) or self._reply_header_end(lines, i) is not None \
+                    or self._is_quoted_header_block(lines, i):
+                break
+            if lines[i].strip():
+                block += 1
+        return block <= DISCLAIMER_MAX_LINES
+
+    @staticmethod
+    def _is_quoted_header_block(lines, start):
+        """True for a complete Outlook header block (From, Sent/Date, To or Subject) followed by content."""
+        if not lines[start].lstrip().lstrip('*').lower().startswith('from:'):
+            return False
+        fields = set()
+        end = start
+        while end < len(lines) and _HEADER_FIELD.match(lines[end]):
+            fields.add(_HEADER_FIELD.match(lines[end]).group(1).lower())
+            end += 1
+        if not ({'sent', 'date'} & fields and {'to', 'subject'} & fields):
+            return False
+        return any(line.strip() for line in lines[end:])
+
+    @staticmethod
+    def _reply_header_end(lines, start):
+        """Return the index after an "On ... wrote:" header starting at `start`, or None."""
+        if not lines[start].lstrip()[:3].lower() in ("on ", "le ", "am "):
+            return None
+        for end in range(start + 1, min(start + 4, len(lines) + 1)):
+            header = " ".join(line.strip() for line in lines[start:end])
+            if _REPLY_HEADER.match(header):
+                return end if _HEADER_DETAIL.search(header) else None
+        return None
+
+    @staticmethod
+    def _drop_repeated_trailers(contents):
+        """Remove trailing paragraphs (signatures, disclaimers) that several messages share."""
+        paragraphs = [[p.strip() for p in _BLANK_LINES.split(content) if p.strip()] for content in contents]
+        seen = {}
+        for blocks in paragraphs:
+            for block in set(blocks[1:]):
+                seen[block] = seen.get(block, 0) + 1
+        repeated = {block for block, count in seen.items() if count > 1}
+        if not repeated:
+            return contents
+
+        result = []
+        for content, blocks in zip(contents, paragraphs):
+            end = len(blocks)
+            while end > 1 and blocks[end - 1] in repeated:
+                end -= 1
+            result.append(content if end == len(blocks) else "\n\n".join(blocks[:end]))
+        return result
@@ -0,0 +1,146 @@
+import heapq
+import logging
+import itertools
+import threading
+from datetime import datetime, timezone
+
+
+def parse_reminder_time(value):
+    """Parse an ISO reminder time, treating naive times as UTC."""
+    reminder_time = datetime.fromisoformat(value)
+    if reminder_time.tzinfo is None:
+        reminder_time = reminder_time.replace(tzinfo=timezone.utc)
+    return reminder_time
+
+
+class ReminderScheduler:
+    """Min-heap of flagged, unanswered reminders ordered by reminder_time.
+
+    Due reminders move from the heap to a ready set, where they stay until
+    they are cancelled (read/unflagged) or rescheduled. Cancelled and
+    rescheduled entries are dropped lazily when they reach the top of the heap.
+    """
+
+    def __init__(self):
+        self._heap = []     # (timestamp, seq, message_id)
+        self._active = {}   # message_id -> (timestamp, seq, reminder)
+        self._ready = {}    # message_id -> reminder
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopped = False
+
+    def load(self, reminders):
+        """Replace the schedule with (message_id, reminder) pairs."""
+        with self._cond:
+            self._heap, self._active, self._ready = [], {}, {}
+            for message_id, reminder in reminders:
+                self._schedule_locked(message_id, reminder)
+            self._cond.notify_all()
+
+    def schedule(self, message_id, reminder):
+        """Add or reschedule a reminder. Returns False if its time cannot be parsed."""
+        with self._cond:
+            scheduled = self._schedule_locked(message_id, reminder)
+            self._cond.notify_all()
+            return scheduled
+
+    def _schedule_locked(self, message_id, reminder):
+        self._active.pop(message_id, None)
+        self._ready.pop(message_id, None)
+        try:
+            reminder_time = parse_reminder_time(reminder["reminder_time"])
+        except (KeyError, TypeError, ValueError) as e:
+            logging.error(f"Error parsing reminder time for email {message_id}: {e}")
+            return False
+
+        entry = dict(reminder, message_id=message_id, reminder_time=reminder_time)
+        timestamp = reminder_time.timestamp()
+        seq = next(self._seq)
+        self._active[message_id] = (timestamp, seq, entry)
+        heapq.heappush(self._heap, (timestamp, seq, message_id))
+        if len(self._heap) > 2 * len(self._active) + 64:
+            self._compact_locked()
+        return True
+
+    def cancel(self, message_id):
+        """Drop a reminder that was read or unflagged."""
+        with self._cond:
+            self._active.pop(message_id, None)
+            self._ready.pop(message_id, None)
+
+    def _compact_locked(self):
+        """Rebuild the heap without cancelled or superseded entries."""
+        self._heap = [(timestamp, seq, message_id)
+                      for message_id, (timestamp, seq, _) in self._active.items()]
+        heapq.heapify(self._heap)
+
+    def _next_timestamp_locked(self):
+        while self._heap:
+            timestamp, seq, message_id = self._heap[0]
+            active = self._active.get(message_id)
+            if active is not None and active[1] == seq:
+                return timestamp
+            heapq.heappop(self._heap)
+        return None
+
+    def collect_due(self, now=None):
+        """Move reminders due at `now` into the ready set and return the newly due ones."""
+        now_ts = (now or datetime.now(timezone.utc)).timestamp()
+        newly_due = []
+        with self._cond:
+            while True:
+                timestamp = self._next_timestamp_locked()
+                if timestamp is None or timestamp > now_ts:
+                    break
+                _, _, message_id = heapq.heappop(self._heap)
+                _, _, entry = self._active.pop(message_id)
+                self._ready[message_id] = entry
+                newly_due.append(entry)
+        return newly_due
+
+    def due_reminders(self, now=None):
+        """Return every due reminder that has not been handled, oldest first."""
+        self.collect_due(now)
+        with self._cond:
+            return sorted(self._ready.values(), key=lambda entry: entry["reminder_time"])
+
+    def next_due_time(self):
+        """Return when the next scheduled reminder is due, or None."""
+        with self._cond:
+            timestamp = self._next_timestamp_locked()
+        return datetime.fromtimestamp(timestamp, tz=timezone.utc) if timestamp is not None else None
+
+    def start(self, callback):
+        """Run a background thread that calls callback(newly_due) as reminders come due."""
+        with self._cond:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopped = False
+            self._thread = threading.Thread(target=self._run, args=(callback,),
+                                            name="reminder-scheduler", daemon=True)
+            self._thread.start()
+
+    def _run(self, callback):
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    timestamp = self._next_timestamp_locked()
+                    now_ts = datetime.now(timezone.utc).timestamp()
+                    if timestamp is not None and timestamp <= now_ts:
+                        break
+                    # Sleep until the next reminder is due, or until the schedule changes
+                    self._cond.wait(None if timestamp is None else timestamp - now_ts)
+                if self._stopped:
+                    return
+            newly_due = self.collect_due()
+            if newly_due:
+                try:
+                    callback(newly_due)
+                except Exception as e:
+                    logging.error(f"Error in reminder callback: {str(e)}")
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
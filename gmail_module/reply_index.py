@@ -0,0 +1,289 @@
+import os
+import json
+import logging
+import threading
+import numpy as np
+
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+# Characters of a reply or incoming email that are embedded
+MAX_EMBED_CHARS = 2000
+# Below this many replies a search scans every vector; above it the inverted lists are used
+IVF_MIN_VECTORS = 20000
+# The clustering is retrained once the index has grown this many times since the last training
+IVF_RETRAIN_GROWTH = 4
+KMEANS_ITERATIONS = 10
+# Vectors per cluster sampled to train the clustering
+KMEANS_SAMPLE_PER_LIST = 40
+
+
+class TransformerEmbedder:
+    """Mean-pooled, L2-normalized sentence embeddings from a transformers pipeline.
+
+    The model is loaded on first use, so managers that never suggest past
+    replies do not pay for it.
+    """
+
+    def __init__(self, model_name=EMBEDDING_MODEL, batch_size=32):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self._pipeline = None
+        self._lock = threading.Lock()
+
+    def __call__(self, texts):
+        with self._lock:
+            if self._pipeline is None:
+                from transformers import pipeline
+                self._pipeline = pipeline("feature-extraction", model=self.model_name)
+            outputs = self._pipeline([text[:MAX_EMBED_CHARS] for text in texts],
+                                     truncation=True, batch_size=self.batch_size)
+        vectors = np.array([np.asarray(output[0]).mean(axis=0) for output in outputs], dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+
+def _normalize_rows(matrix):
+    return matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+
+def train_centroids(vectors, n_lists, iterations=KMEANS_ITERATIONS, seed=0):
+    """Spherical k-means: n_lists unit centroids of unit vectors, by cosine similarity."""
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(vectors), n_lists * KMEANS_SAMPLE_PER_LIST)
+    sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+    centroids = sample[rng.choice(sample_size, n_lists, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, sample)
+        # Empty clusters keep their previous centroid
+        empty = ~sums.any(axis=1)
+        sums[empty] = centroids[empty]
+        centroids = _normalize_rows(sums)
+    return centroids
+
+
+class ReplyIndex:
+    """On-disk index of embedded sent replies with approximate top-k cosine search.
+
+    Vectors are appended as float16 to `vectors.f16` and reply metadata as
+    JSON lines to `replies.jsonl`, so adding replies never rewrites them; the
+    vector dimension is kept in `meta.json`. After an interrupted write both
+    files are truncated back to their complete (vector, reply) pairs. In
+    memory the vectors live in one float32 matrix grown by doubling, and only
+    byte offsets of the metadata lines are kept.
+
+    Small indexes are searched exhaustively. From IVF_MIN_VECTORS replies on,
+    the vectors are clustered with k-means (`centroids.npy`) and each reply's
+    cluster is appended to `lists.i32`; a search then scores only the replies
+    in the `n_probe` clusters closest to the query. New replies join their
+    nearest cluster, and the clustering is retrained as the index grows.
+    """
+
+    def __init__(self, index_dir="reply_index", embed=None, n_probe=None):
+        self.index_dir = index_dir
+        self.embed = embed or TransformerEmbedder()
+        # Clusters scanned per search; defaults to 1/16 of them (at least 8)
+        self.n_probe = n_probe
+        self._vectors_path = os.path.join(index_dir, "vectors.f16")
+        self._replies_path = os.path.join(index_dir, "replies.jsonl")
+        self._centroids_path = os.path.join(index_dir, "centroids.npy")
+        self._lists_path = os.path.join(index_dir, "lists.i32")
+        self._meta_path = os.path.join(index_dir, "meta.json")
+        self._lock = threading.Lock()
+        self._matrix = None
+        self._lists = None
+        self._centroids = None
+        self._trained_on = 0
+        self._dim = None
+        self._offsets = []
+        self._ids = set()
+        self._load()
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def __contains__(self, message_id):
+        return message_id in self._ids
+
+    def _load(self):
+        if not os.path.exists(self._replies_path) or not os.path.exists(self._vectors_path):
+            return
+        offsets, ids = [], []
+        with open(self._replies_path, 'rb') as replies:
+            offset = 0
+            for line in replies:
+                try:
+                    ids.append(json.loads(line)['id'])
+                except (json.JSONDecodeError, KeyError):
+                    # A line cut short by a crash ends the usable part of the file
+                    break
+                offsets.append(offset)
+                offset += len(line)
+        vectors = np.fromfile(self._vectors_path, dtype=np.float16)
+        self._dim = self._load_dim(len(offsets), vectors.size)
+        if self._dim is None:
+            if offsets or vectors.size:
+                self._set_aside()
+            return
+        count = min(len(offsets), vectors.size // self._dim)
+        replies_end = offsets[count] if count < len(offsets) else offset
+        if replies_end < os.path.getsize(self._replies_path) or count * self._dim < vectors.size:
+            self._truncate(count, replies_end)
+        if not count:
+            return
+        self._offsets = offsets[:count]
+        self._ids = set(ids[:count])
+        self._matrix = vectors[:count * self._dim].reshape(count, self._dim).astype(np.float32)
+
+        if os.path.exists(self._centroids_path):
+            self._centroids = np.load(self._centroids_path)
+            lists = np.fromfile(self._lists_path, dtype=np.int32) if os.path.exists(self._lists_path) else []
+            self._trained_on = len(self._centroids) ** 2
+            if len(lists) != count:
+                # Assign replies the interrupted write left out, drop entries past the last
+                # complete reply, and rewrite the file so later appends line up with the rows
+                if len(lists) < count:
+                    lists = np.concatenate([lists, self._assign(self._matrix[len(lists):count])])
+                lists = np.asarray(lists[:count], dtype=np.int32)
+                lists.tofile(self._lists_path)
+            self._lists = np.asarray(lists, dtype=np.int32)
+
+    def _load_dim(self, reply_count, vector_size):
+        """Return the stored vector dimension; indexes written before meta.json infer it from whole files."""
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path) as f:
+                return json.load(f)['dim']
+        if reply_count and vector_size and vector_size % reply_count == 0:
+            dim = vector_size // reply_count
+            self._save_dim(dim)
+            return dim
+        return None
+
+    def _save_dim(self, dim):
+        temp_path = self._meta_path + ".tmp"
+        with open(temp_path, 'w') as f:
+            json.dump({'dim': dim}, f)
+        os.replace(temp_path, self._meta_path)
+
+    def _set_aside(self):
+        """Move files whose pairing cannot be recovered out of the way; the index is rebuilt from sent mail."""
+        logging.error(f"Reply index in {self.index_dir} has no recorded dimension and mismatched files; "
+                      f"moving them aside.")
+        for path in (self._replies_path, self._vectors_path, self._centroids_path, self._lists_path):
+            if os.path.exists(path):
+                os.replace(path, path + ".corrupt")
+
+    def _truncate(self, count, replies_size):
+        """Cut both files back to their first count complete (vector, reply) pairs."""
+        with open(self._replies_path, 'r+b') as replies_file:
+            replies_file.truncate(replies_size)
+        with open(self._vectors_path, 'r+b') as vectors_file:
+            vectors_file.truncate(count * self._dim * np.dtype(np.float16).itemsize)
+
+    def add(self, replies):
+        """Embed and append replies (dicts with id, text and optional subject); known ids are skipped."""
+        replies = [reply for reply in replies if reply['id'] not in self._ids and reply.get('text', '').strip()]
+        if not replies:
+            return 0
+        vectors = self.embed([reply['text'] for reply in replies]).astype(np.float32)
+
+        with self._lock:
+            os.makedirs(self.index_dir, exist_ok=True)
+            if self._dim is None:
+                self._dim = vectors.shape[1]
+                self._save_dim(self._dim)
+            with open(self._replies_path, 'ab') as replies_file:
+                offset = replies_file.tell()
+                for reply in replies:
+                    line = (json.dumps({'id': reply['id'], 'subject': reply.get('subject', ''),
+                                        'text': reply['text']}) + "\n").encode()
+                    replies_file.write(line)
+                    self._offsets.append(offset)
+                    offset += len(line)
+                    self._ids.add(reply['id'])
+            with open(self._vectors_path, 'ab') as vectors_file:
+                vectors.astype(np.float16).tofile(vectors_file)
+            self._matrix = self._append(self._matrix, vectors)
+
+            count = len(self._offsets)
+            if (self._centroids is None and count >= IVF_MIN_VECTORS) or \
+                    (self._centroids is not None and count >= IVF_RETRAIN_GROWTH * self._trained_on):
+                self._train()
+            elif self._centroids is not None:
+                assignment = self._assign(vectors)
+                with open(self._lists_path, 'ab') as lists_file:
+                    assignment.tofile(lists_file)
+                self._lists = self._append(self._lists, assignment)
+        return len(replies)
+
+    def _append(self, array, rows):
+        """Write rows after the first len(self) - len(rows) entries of array, doubling its capacity if needed."""
+        count = len(self._offsets) - len(rows)
+        if array is None:
+            array = np.empty((max(len(rows), 1024),) + rows.shape[1:], dtype=rows.dtype)
+        elif len(array) < count + len(rows):
+            grown = np.empty((max(2 * len(array), count + len(rows)),) + array.shape[1:], dtype=array.dtype)
+            grown[:count] = array[:count]
+            array = grown
+        array[count:count + len(rows)] = rows
+        return array
+
+    def _assign(self, vectors):
+        return np.argmax(vectors @ self._centroids.T, axis=1).astype(np.int32)
+
+    def _train(self):
+        """Cluster every vector and rewrite the centroids and inverted lists."""
+        count = len(self._offsets)
+        vectors = self._matrix[:count]
+        self._centroids = train_centroids(vectors, max(int(np.sqrt(count)), 1))
+        # Assign in slices to bound the size of the similarity matrix
+        lists = np.concatenate([self._assign(vectors[start:start + 8192])
+                                for start in range(0, count, 8192)])
+        np.save(self._centroids_path, self._centroids)
+        lists.tofile(self._lists_path)
+        self._lists = np.empty(max(count, 1024), dtype=np.int32)
+        self._lists[:count] = lists
+        # The number of lists is sqrt(count), so this is also what _load recovers
+        self._trained_on = len(self._centroids) ** 2
+
+    def _candidates(self, query, count):
+        """Row numbers of the replies in the clusters nearest to query (all rows without clustering)."""
+        if self._centroids is None:
+            return None
+        n_probe = self.n_probe or max(8, len(self._centroids) // 16)
+        if n_probe >= len(self._centroids):
+            return None
+        probed = np.zeros(len(self._centroids), dtype=bool)
+        probed[np.argpartition(-(self._centroids @ query), n_probe - 1)[:n_probe]] = True
+        return np.flatnonzero(probed[self._lists[:count]])
+
+    def search(self, text, k=3, min_score=0.3):
+        """Return up to k past replies most similar to text, best first, with a 'score'."""
+        if not self._offsets:
+            return []
+        query = self.embed([text])[0].astype(np.float32)
+        with self._lock:
+            count = len(self._offsets)
+            rows = self._candidates(query, count)
+            scores = self._matrix[:count] @ query if rows is None else self._matrix[rows] @ query
+            if not len(scores):
+                return []
+            k = min(k, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            if rows is not None:
+                scores, top = scores[top], rows[top]
+            else:
+                scores = scores[top]
+            offsets = [self._offsets[i] for i in top]
+
+        results = []
+        with open(self._replies_path, 'rb') as replies_file:
+            for score, offset in zip(scores, offsets):
+                if score < min_score:
+                    continue
+                replies_file.seek(offset)
+                reply = json.loads(replies_file.readline())
+                reply['score'] = float(score)
+                results.append(reply)
+        return results
@@ -1,7 +1,12 @@
+import logging
+
+
 class ResponseSuggester:
     """Class to generate response suggestions for emails."""
     
-    def __init__(self):
+    def __init__(self, reply_index=None):
+        # Optional ReplyIndex of the user's own sent replies
+        self.reply_index = reply_index
         self.common_responses = {
             "acknowledgment": "Thank you for your email. I've received it and will get back to you shortly.",
             "meeting_accept": "I'd be happy to meet with you. The proposed time works for me.",
@@ -14,6 +19,18 @@ class ResponseSuggester:
         """Generate response suggestions based on email content and context."""
         suggestions = []
         
+        # Past replies the user sent to similar emails come first
+        if self.reply_index is not None and email_content.strip():
+            try:
+                for reply in self.reply_index.search(email_content):
+                    suggestions.append({
+                        "type": "past_reply",
+                        "text": reply['text'],
+                        "score": reply['score']
+                    })
+            except Exception as e:
+                logging.error(f"Error searching past replies: {str(e)}")
+        
         # Basic acknowledgment (always offer this)
         suggestions.append({
             "type": "acknowledgment",
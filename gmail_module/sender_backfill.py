@@ -0,0 +1,163 @@
+import os
+import sys
+import json
+import logging
+import argparse
+from datetime import datetime
+from .gmail_functions import GmailPriorityManager
+
+# Inbound mail and the user's replies; everything else cannot contribute a response
+BACKFILL_QUERY = 'in:inbox OR in:sent'
+BACKFILL_FIELDS = 'id,threadId,labelIds,internalDate,payload/headers'
+# users.messages.list maximum; progress is checkpointed after every page
+BACKFILL_PAGE_SIZE = 500
+# Extra fetches of a page's failed messages before the run stops without advancing the checkpoint
+BACKFILL_PAGE_RETRIES = 2
+
+
+class SenderStatsBackfill:
+    """Rebuild per-sender response stats from existing inbox and sent history.
+
+    Messages are listed newest first and fetched with format=metadata (From
+    header, labels, internalDate) in batches. Because the pass runs backwards
+    in time, the earliest reply already seen in a thread is the first reply to
+    any older inbound message of that thread, so response and latency are
+    known the moment an inbound message is reached; only one timestamp per
+    thread is kept.
+
+    After every page the list token and running totals are written to a
+    checkpoint file, so an interrupted run resumes where it stopped. The
+    totals are merged into the behavior store in one transaction at the end.
+    """
+
+    def __init__(self, manager, state_path=None, query=BACKFILL_QUERY):
+        self.manager = manager
+        self.state_path = state_path or os.path.splitext(manager.behavior_file)[0] + "_backfill.json"
+        self.query = query
+
+    def run(self, limit=None, restart=False):
+        """Backfill and merge the stats. Returns the number of senders written.
+
+        With `limit`, stops after the list page on which that many messages
+        were reached; a later run continues from the next page.
+        """
+        state = None if restart else self._load_state()
+        if state is None:
+            state = {'page_token': None, 'processed': 0, 'threads': {}, 'senders': {}, 'complete': False}
+        elif state['complete']:
+            logging.info(f"Sender backfill already complete ({state['processed']} messages); "
+                         f"use restart to rerun.")
+            return 0
+
+        fetcher = self.manager._batch_fetcher()
+        service = self.manager.service
+        while not state['complete'] and (limit is None or state['processed'] < limit):
+            params = {'userId': 'me', 'q': self.query, 'maxResults': BACKFILL_PAGE_SIZE}
+            if state['page_token']:
+                params['pageToken'] = state['page_token']
+            response = service.users().messages().list(**params).execute()
+            message_ids = [message['id'] for message in response.get('messages', [])]
+
+            messages = self._fetch_page(fetcher, message_ids)
+            if messages is None:
+                # Resuming re-lists this page, so nothing of it is folded in or checkpointed
+                logging.error(f"Sender backfill stopped: messages of the page at {state['processed']} "
+                              f"could not be fetched; rerun to retry it.")
+                break
+            self._process(messages.values(), state)
+            state['processed'] += len(message_ids)
+            state['page_token'] = response.get('nextPageToken')
+            state['complete'] = not state['page_token']
+            self._save_state(state)
+            logging.info(f"Sender backfill: {state['processed']} messages, {len(state['senders'])} senders")
+
+        return self.manager.behavior_store.merge_sender_stats({
+            sender: {
+                'total_emails': total,
+                'responses': responses,
+                'response_latency': latency_sum / responses if responses else None,
+                'last_interaction': datetime.fromtimestamp(last_ms / 1000).isoformat()
+            }
+            for sender, (total, responses, latency_sum, last_ms) in state['senders'].items()
+        })
+
+    @staticmethod
+    def _fetch_page(fetcher, message_ids):
+        """Return the metadata of every message of a page, or None if some still fail after retries."""
+        messages = {}
+        missing = message_ids
+        for _ in range(BACKFILL_PAGE_RETRIES + 1):
+            messages.update(fetcher.get_messages(missing, format='metadata', metadataHeaders=['From'],
+                                                 fields=BACKFILL_FIELDS))
+            missing = [message_id for message_id in message_ids if message_id not in messages]
+            if not missing:
+                return messages
+        return None
+
+    @staticmethod
+    def _process(messages, state):
+        """Fold one page of metadata into the running per-thread and per-sender state."""
+        threads, senders = state['threads'], state['senders']
+        # A page is newest first as listed, but the batch returns it unordered
+        for message in sorted(messages, key=lambda m: -int(m.get('internalDate', 0))):
+            sent_at = int(message.get('internalDate', 0))
+            labels = message.get('labelIds', [])
+            thread_id = message.get('threadId')
+            if 'SENT' in labels:
+                threads[thread_id] = min(threads.get(thread_id, sent_at), sent_at)
+                continue
+            if 'DRAFT' in labels:
+                continue
+            sender = next((header['value'] for header in message.get('payload', {}).get('headers', [])
+                           if header['name'].lower() == 'from'), '')
+            if not sender:
+                continue
+            stats = senders.setdefault(sender, [0, 0, 0.0, 0])
+            stats[0] += 1
+            replied_at = threads.get(thread_id)
+            if replied_at is not None and replied_at >= sent_at:
+                stats[1] += 1
+                stats[2] += (replied_at - sent_at) / 1000
+            stats[3] = max(stats[3], sent_at)
+
+    def _load_state(self):
+        if not os.path.exists(self.state_path):
+            return None
+        try:
+            with open(self.state_path) as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logging.error(f"Could not read backfill checkpoint {self.state_path}: {str(e)}")
+            return None
+
+    def _save_state(self, state):
+        # Write then rename, so a crash never leaves a half-written checkpoint
+        temp_path = self.state_path + ".tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(temp_path, self.state_path)
+
+
+def main(argv=None):
+    """Command line entry point: python -m gmail_module.sender_backfill"""
+    parser = argparse.ArgumentParser(description="Backfill sender response stats from mailbox history.")
+    parser.add_argument("--credentials", default="credentials.json", help="OAuth client secrets")
+    parser.add_argument("--token", default="token.pickle", help="stored OAuth token")
+    parser.add_argument("--behavior-file", default="user_behavior.json", help="sender history to update")
+    parser.add_argument("--limit", type=int, help="stop after the page that reaches this many messages")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and start over")
+    args = parser.parse_args(argv)
+
+    manager = GmailPriorityManager(credentials_path=args.credentials, token_path=args.token,
+                                   behavior_file=args.behavior_file, mirror_path=None, reply_index_dir=None,
+                                   behavior_log_dir=None, outbox_path=None)
+    try:
+        written = SenderStatsBackfill(manager).run(limit=args.limit, restart=args.restart)
+        print(f"Updated response stats for {written} senders.")
+    finally:
+        manager.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+import threading
+import httplib2
+import google_auth_httplib2
+import google.auth.credentials
+from google.auth.transport.requests import Request
+from googleapiclient.discovery import build
+
+
+class SharedCredentials(google.auth.credentials.Credentials):
+    """Credentials proxy that serializes token refreshes across threads.
+
+    httplib2 transports are not thread-safe, so every thread gets its own, but
+    they all share one credentials object. Without a lock, threads that see an
+    expired token at the same moment would all refresh it at once.
+
+    It is a google.auth Credentials so that googleapiclient (batch requests
+    check `is_valid` on it) treats it like the wrapped credentials; the base
+    initializer is skipped and every other attribute is read from them.
+    """
+
+    def __init__(self, credentials, on_refresh=None):
+        self._credentials = credentials
+        self._lock = threading.Lock()
+        self._on_refresh = on_refresh
+
+    @property
+    def valid(self):
+        return self._credentials.valid
+
+    @property
+    def expired(self):
+        return self._credentials.expired
+
+    def apply(self, headers, token=None):
+        self._credentials.apply(headers, token=token)
+
+    def before_request(self, request, method, url, headers):
+        if not self._credentials.valid:
+            self._refresh(self._credentials.token)
+        self._credentials.apply(headers)
+
+    def refresh(self, request):
+        # Called after a 401 or by batch requests: refresh unless another thread already did
+        self._refresh(self._credentials.token)
+
+    def _refresh(self, stale_token):
+        with self._lock:
+            if self._credentials.token == stale_token:
+                self._credentials.refresh(Request())
+                if self._on_refresh is not None:
+                    self._on_refresh(self._credentials)
+
+    def __getattr__(self, name):
+        if name == '_credentials':
+            raise AttributeError(name)
+        return getattr(self._credentials, name)
+
+
+class GmailServicePool:
+    """One Gmail service per thread, each with its own keep-alive HTTP connection."""
+
+    def __init__(self, credentials, on_refresh=None):
+        self.credentials = SharedCredentials(credentials, on_refresh)
+        self._local = threading.local()
+
+    def get(self):
+        """Return the calling thread's Gmail service, building it on first use."""
+        service = getattr(self._local, 'service', None)
+        if service is None:
+            authorized_http = google_auth_httplib2.AuthorizedHttp(
+                self.credentials, http=httplib2.Http(timeout=60))
+            service = build("gmail", "v1", http=authorized_http, cache_discovery=False)
+            self._local.service = service
+        return service
@@ -0,0 +1,92 @@
+import time
+import logging
+
+
+class ChunkedSummarizer:
+    """Map-reduce summarization over tokenizer-sized chunks.
+
+    Long text is split by token count into equal-sized chunks that fit the
+    model window, the chunks are summarized as one batch (map), and the
+    partial summaries are summarized again until they fit a single call
+    (reduce). `max_chunks` and
+    `latency_budget` (seconds) bound the cost of very long threads: chunks
+    beyond the limit are sampled evenly, and once the budget is spent the
+    remaining work is skipped and the best summary so far is returned.
+    """
+
+    def __init__(self, summarizer, max_chunk_tokens=900, max_chunks=8, batch_size=4,
+                 latency_budget=30.0, max_length=120, min_length=30):
+        self.summarizer = summarizer
+        self.max_chunk_tokens = max_chunk_tokens
+        self.max_chunks = max_chunks
+        self.batch_size = batch_size
+        self.latency_budget = latency_budget
+        self.max_length = max_length
+        self.min_length = min_length
+
+    def summarize(self, text):
+        """Summarize text of any length within the latency budget."""
+        deadline = time.monotonic() + self.latency_budget
+        chunks = self._split(text)
+        if len(chunks) == 1:
+            return self._run([chunks[0][0]], chunks[0][1])[0]
+
+        # Map: summarize the chunks in batches, stopping once the budget is spent
+        partials = []
+        for start in range(0, len(chunks), self.batch_size):
+            if partials and time.monotonic() >= deadline:
+                logging.warning(f"Summary latency budget reached after {len(partials)}/{len(chunks)} chunks.")
+                break
+            batch = chunks[start:start + self.batch_size]
+            partials.extend(self._run([chunk for chunk, _ in batch],
+                                      min(token_count for _, token_count in batch)))
+
+        # Reduce: summarize the joined partial summaries until they fit one call
+        combined = " ".join(partials)
+        while time.monotonic() < deadline:
+            reduced = self._split(combined)
+            if len(reduced) == 1:
+                return self._run([reduced[0][0]], reduced[0][1])[0]
+            combined = " ".join(self._run([chunk for chunk, _ in reduced],
+                                          min(token_count for _, token_count in reduced)))
+        return combined
+
+    def fits_one_call(self, text):
+        """Return True if text fits a single model call without chunking."""
+        token_ids = self.summarizer.tokenizer(text, add_special_tokens=False, truncation=False)['input_ids']
+        return len(token_ids) <= self.max_chunk_tokens
+
+    def _split(self, text):
+        """Split text into (chunk_text, token_count) pieces of at most max_chunk_tokens tokens."""
+        tokenizer = self.summarizer.tokenizer
+        token_ids = tokenizer(text, add_special_tokens=False, truncation=False)['input_ids']
+        if len(token_ids) <= self.max_chunk_tokens:
+            return [(text, len(token_ids))]
+
+        # Equal-sized chunks: a batch shares one min/max summary length, so a short
+        # tail chunk would otherwise cap the summaries of the full chunks beside it
+        chunk_count = -(-len(token_ids) // self.max_chunk_tokens)
+        chunk_tokens = -(-len(token_ids) // chunk_count)
+        spans = [(start, min(start + chunk_tokens, len(token_ids)))
+                 for start in range(0, len(token_ids), chunk_tokens)]
+        if len(spans) > self.max_chunks:
+            # Sample evenly, always keeping the first and the latest chunk
+            step = (len(spans) - 1) / (self.max_chunks - 1)
+            spans = [spans[round(i * step)] for i in range(self.max_chunks)]
+
+        return [(tokenizer.decode(token_ids[start:end], skip_special_tokens=True), end - start)
+                for start, end in spans]
+
+    def _run(self, texts, shortest_tokens):
+        """Summarize a batch of texts in one pipeline call."""
+        min_length = max(5, min(self.min_length, shortest_tokens // 2))
+        max_length = max(min_length + 1, min(self.max_length, shortest_tokens))
+        outputs = self.summarizer(
+            texts,
+            max_length=max_length,
+            min_length=min_length,
+            do_sample=False,
+            truncation=True,
+            batch_size=self.batch_size
+        )
+        return [output['summary_text'] for output in outputs]
@@ -0,0 +1,79 @@
+import sys
+import logging
+import argparse
+import numpy as np
+from .gmail_functions import GmailPriorityManager
+from .mailbox_mirror import MailboxMirror
+from .behavior_log import BehaviorLog
+from .priority_model import PriorityModel, FEATURE_NAMES
+
+
+def load_labels(log_dir, action="marked_urgent"):
+    """Return the ids of emails with the given action in the behavior log."""
+    return BehaviorLog(log_dir).email_ids(action)
+
+
+def build_training_set(manager, mirror, urgent_ids, batch_size=256):
+    """Return (features, labels) for every mirrored message; marked_urgent emails are positives."""
+    thread_sizes = mirror.thread_sizes()
+    feature_blocks, labels, batch = [], [], []
+
+    def flush():
+        email_data_list = [{
+            'subject': message['subject'],
+            'content': message['content'] or message['snippet'],
+            'sender': message['sender'],
+            'is_important': 'IMPORTANT' in message['labelIds'],
+            'thread_length': thread_sizes.get(message['threadId'], 1)
+        } for message in batch]
+        counts = [feature['total'] for feature in manager.keyword_matcher.scan_batch(
+            [f"{email_data['subject']} {email_data['content']}" for email_data in email_data_list])]
+        feature_blocks.append(manager.priority_features(email_data_list, counts, with_sentiment=True))
+        labels.extend(1 if message['id'] in urgent_ids else 0 for message in batch)
+        batch.clear()
+
+    for message in mirror.iter_messages():
+        batch.append(message)
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+
+    if not feature_blocks:
+        return np.zeros((0, len(FEATURE_NAMES))), np.zeros(0)
+    return np.vstack(feature_blocks), np.array(labels)
+
+
+def main(argv=None):
+    """Command line entry point: python -m gmail_module.train_priority -o priority_weights.json"""
+    parser = argparse.ArgumentParser(description="Train priority weights from the user behavior log.")
+    parser.add_argument("--log", default="user_behavior_log",
+                        help="behavior log directory (imports user_behavior_log.json on first use)")
+    parser.add_argument("--mirror", default="mailbox_mirror.db", help="mailbox mirror holding the emails")
+    parser.add_argument("--behavior-file", default="user_behavior.json", help="sender history")
+    parser.add_argument("-o", "--output", default="priority_weights.json", help="weights file to write")
+    args = parser.parse_args(argv)
+
+    urgent_ids = load_labels(args.log)
+    manager = GmailPriorityManager(behavior_file=args.behavior_file, mirror_path=None,
+                                   priority_model_path=None, reply_index_dir=None, behavior_log_dir=None,
+                                   connect=False)
+    mirror = MailboxMirror(args.mirror)
+    features, labels = build_training_set(manager, mirror, urgent_ids)
+    missing = len(urgent_ids) - int(labels.sum())
+    if missing:
+        logging.warning(f"{missing} marked_urgent email(s) are not in the mirror and were skipped.")
+    if labels.sum() == 0 or labels.sum() == len(labels):
+        logging.error("Training needs both marked_urgent and other emails in the mirror.")
+        return 1
+
+    model = PriorityModel.train(features, labels)
+    model.save(args.output)
+    print(f"Trained on {len(labels)} emails ({int(labels.sum())} marked urgent) -> {args.output}")
+    for name, weight in zip(FEATURE_NAMES, model.weights):
+        print(f"  {name}: {weight:.3f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
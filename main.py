@@ -30,6 +30,9 @@ print(f"TWILIO_ACCOUNT_SID: {os.getenv('TWILIO_ACCOUNT_SID')}")
 print(f"TWILIO_AUTH_TOKEN: {os.getenv('TWILIO_AUTH_TOKEN')}")
 print(f"TWILIO_WHATSAPP_NUMBER: {os.getenv('TWILIO_WHATSAPP_NUMBER')}")
 
+# Emails analyzed ahead in the background while the current one is on screen
+PREFETCH_EMAILS = 5
+
 # Set SSL context to use certifi certificates
 ssl_context = ssl.create_default_context(cafile=certifi.where())
 
@@ -63,11 +66,12 @@ def whatsapp_webhook():
     whatsapp_assistant.handle_incoming_message(data, action)
     return jsonify({"status": "success"}), 200
 
-def handle_email_response(gmail_manager, message_id):
+def handle_email_response(gmail_manager, message_id, result=None):
     """Handle email processing and response."""
     try:
-        # Process the email
-        result = gmail_manager.process_new_email(message_id)
+        # Process the email unless the caller already did
+        if result is None:
+            result = gmail_manager.process_new_email(message_id)
         
         # Get email data and thread summary
         email_data = result['email_data']
@@ -94,7 +98,7 @@ def handle_email_response(gmail_manager, message_id):
                     if 1 <= choice <= len(response_suggestions):
                         selected_response = response_suggestions[choice - 1]
                         sent_message = gmail_manager.send_quick_response(email_data, selected_response['text'])
-                        print(f"Response sent: {selected_response['type'].replace('_', ' ').title()}")
+                        print(f"Response queued: {selected_response['type'].replace('_', ' ').title()}")
                         break
                     else:
                         print(f"Invalid selection. Please select a number between 1 and {len(response_suggestions)}.")
@@ -138,37 +142,47 @@ def gmail_menu(gmail_manager):
         print("\n===== Gmail Menu =====")
         print("1. Check Priority Inbox")
         print("2. Check Reminders")
-        print("3. Back to Main Menu")
+        print("3. Learn Replies from Sent Mail")
+        print("4. Back to Main Menu")
 
-        choice = input("\nSelect an option (1-3): ")
+        choice = input("\nSelect an option (1-4): ")
 
         if choice == '1':
             # Get recent messages
             try:
-                results = gmail_manager.service.users().messages().list(userId='me', maxResults=10).execute()
-                messages = results.get('messages', [])
-                
-                if not messages:
-                    print("No recent messages found.")
-                else:
-                    for i, message in enumerate(messages):
+                # Stream the whole mailbox page by page; each chunk is scored on metadata
+                # first and only Urgent/Follow-up mail is fully fetched and summarized,
+                # on a background thread while the current email is on screen
+                emails = gmail_manager.iter_triaged_emails(
+                    query=None, chunk_size=PREFETCH_EMAILS, group_duplicates=True, lookahead=PREFETCH_EMAILS)
+                found = False
+                try:
+                    for i, (message_id, result) in enumerate(emails):
+                        found = True
                         try:
-                            result = gmail_manager.process_new_email(message['id'])
                             print(f"\nEmail {i + 1}")
                             print(f"Subject: {result['thread_summary']['subject']}")
                             print(f"Priority: {result['priority']}")
                             print(f"Summary: {result['thread_summary']['summary'][:100]}...")
+                            if result.get('duplicates'):
+                                print(f"Similar emails: {len(result['duplicates'])} more like this")
                             print("--------------------------")
-                            
+                        
                             # Handle email response
-                            handle_email_response(gmail_manager, message['id'])
-                            
+                            handle_email_response(gmail_manager, message_id, result)
+                        
                             # Option to show next email or go back to menu
                             next_action = input("\nEnter 'n' to see the next email or 'b' to go back to menu: ").lower()
                             if next_action == 'b':
                                 break
                         except Exception as e:
                             print(f"Error processing message: {str(e)}")
+                finally:
+                    # Stops the background analysis when going back to the menu or on an error
+                    emails.close()
+
+                if not found:
+                    print("No recent messages found.")
             except Exception as e:
                 logging.error(f"Error fetching messages: {str(e)}")
         
@@ -182,10 +196,19 @@ def gmail_menu(gmail_manager):
                 logging.error(f"Error checking reminders: {str(e)}")
         
         elif choice == '3':
+            # Embed sent replies not yet in the reply index
+            print("\nIndexing sent replies...")
+            try:
+                added = gmail_manager.build_reply_index()
+                print(f"Indexed {added} new sent replies.")
+            except Exception as e:
+                logging.error(f"Error indexing sent replies: {str(e)}")
+        
+        elif choice == '4':
             break
         
         else:
-            print("Invalid choice. Please select a number between 1 and 3.")
+            print("Invalid choice. Please select a number between 1 and 4.")
 
 def slack_menu(bot_token, user_token, ssl_context):
     slack_summarizer = SlackSummarizer(bot_token, ssl_context=ssl_context)
@@ -294,6 +317,14 @@ def main():
 
     # Display main menu for user interaction
     print("For detailed instructions, please refer to the USER_GUIDE.md file.")
+    try:
+        run_menu()
+    finally:
+        # Send replies and read markers still queued in the outbox before exiting
+        if gmail_manager:
+            gmail_manager.close()
+
+def run_menu():
     while True:
         print("\n===== AI_Communication_Assistant =====")
         print("1. Gmail")
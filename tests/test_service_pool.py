@@ -0,0 +1,79 @@
+import os
+import re
+import importlib.util
+from datetime import datetime, timedelta
+
+import pytest
+
+httplib2 = pytest.importorskip("httplib2")
+pytest.importorskip("googleapiclient")
+pytest.importorskip("google_auth_httplib2")
+from google.oauth2.credentials import Credentials
+
+# Load the module on its own: the package __init__ pulls in the NLP models
+_spec = importlib.util.spec_from_file_location(
+    "service_pool", os.path.join(os.path.dirname(__file__), "..", "gmail_module", "service_pool.py"))
+service_pool = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(service_pool)
+
+
+class FakeBatchHttp:
+    """Answers every part of a batch request with a 200 and records the request headers."""
+
+    def __init__(self):
+        self.headers = []
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        self.headers.append(headers)
+        body = body if isinstance(body, str) else body.decode()
+        parts = "".join(
+            f"--b\r\nContent-Type: application/http\r\nContent-ID: <response-{content_id}>\r\n\r\n"
+            f"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n\r\n{{\"ok\": true}}\r\n"
+            for content_id in re.findall(r"Content-ID: <([^>]+)>", body))
+        response = httplib2.Response({'status': '200', 'content-type': 'multipart/mixed; boundary=b'})
+        return response, (parts + "--b--").encode()
+
+
+def make_credentials(expires_in):
+    credentials = Credentials(token="token-1", refresh_token="refresh", client_id="id", client_secret="secret",
+                              token_uri="https://oauth2.googleapis.com/token")
+    credentials.expiry = datetime.utcnow() + expires_in
+    return credentials
+
+
+def run_batch(pool, message_ids):
+    service = pool.get()
+    transport = FakeBatchHttp()
+    service._http.http = transport
+    results = {}
+    batch = service.new_batch_http_request(
+        callback=lambda request_id, response, exception: results.__setitem__(request_id, (response, exception)))
+    for message_id in message_ids:
+        batch.add(service.users().messages().get(userId='me', id=message_id), request_id=message_id)
+    batch.execute()
+    return results, transport
+
+
+def test_batch_execute_through_pool():
+    pool = service_pool.GmailServicePool(make_credentials(timedelta(hours=1)))
+    results, transport = run_batch(pool, ['m1', 'm2'])
+    assert results == {'m1': ({'ok': True}, None), 'm2': ({'ok': True}, None)}
+    assert transport.headers[0]['authorization'] == 'Bearer token-1'
+
+
+def test_batch_execute_refreshes_expired_token_once():
+    credentials = make_credentials(timedelta(hours=-1))
+    refreshed = []
+
+    def refresh(request):
+        refreshed.append(request)
+        credentials.token = "token-2"
+        credentials.expiry = datetime.utcnow() + timedelta(hours=1)
+
+    credentials.refresh = refresh
+    saved = []
+    pool = service_pool.GmailServicePool(credentials, on_refresh=saved.append)
+    results, transport = run_batch(pool, ['m1'])
+    assert results == {'m1': ({'ok': True}, None)}
+    assert len(refreshed) == 1 and saved == [credentials]
+    assert transport.headers[0]['authorization'] == 'Bearer token-2'
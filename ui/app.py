@@ -55,7 +55,7 @@ def handle_email_response(gmail_manager, message_id):
                     if 1 <= choice <= len(response_suggestions):
                         selected_response = response_suggestions[choice - 1]
                         sent_message = gmail_manager.send_quick_response(email_data, selected_response['text'])
-                        print(f"Response sent: {selected_response['type'].replace('_', ' ').title()}")
+                        print(f"Response queued: {selected_response['type'].replace('_', ' ').title()}")
                         break
                     else:
                         print(f"Invalid selection. Please select a number between 1 and {len(response_suggestions)}.")
@@ -117,25 +117,31 @@ def gmail_menu(gmail_manager):
         if choice == '1':
             # Get recent messages
             try:
-                results = gmail_manager.service.users().messages().list(userId='me', maxResults=10).execute()
-                messages = results.get('messages', [])
-                
-                if not messages:
+                # Follow every result page instead of stopping after the first ten messages
+                found = False
+                for message_id in gmail_manager.iter_message_ids():
+                    if not found:
+                        print("\n----- Priority Inbox -----")
+                        found = True
+                    try:
+                        result = gmail_manager.process_new_email(message_id)
+                        print(f"Subject: {result['thread_summary']['subject']}")
+                        print(f"Priority: {result['priority']}")
+                        print(f"Summary: {result['thread_summary']['summary'][:100]}...")
+                        print("--------------------------")
+
+                        # Handle email response
+                        handle_email_response(gmail_manager, message_id)
+
+                        # Option to show next email or go back to menu
+                        next_action = input("\nEnter 'n' to see the next email or 'b' to go back to menu: ").lower()
+                        if next_action == 'b':
+                            break
+                    except Exception as e:
+                        print(f"Error processing message: {str(e)}")
+
+                if not found:
                     print("No recent messages found.")
-                else:
-                    print("\n----- Priority Inbox -----")
-                    for message in messages:
-                        try:
-                            result = gmail_manager.process_new_email(message['id'])
-                            print(f"Subject: {result['thread_summary']['subject']}")
-                            print(f"Priority: {result['priority']}")
-                            print(f"Summary: {result['thread_summary']['summary'][:100]}...")
-                            print("--------------------------")
-                            
-                            # Handle email response
-                            handle_email_response(gmail_manager, message['id'])
-                        except Exception as e:
-                            print(f"Error processing message: {str(e)}")
             except Exception as e:
                 logging.error(f"Error fetching messages: {str(e)}")
         
@@ -264,8 +270,16 @@ def main():
     user_token = os.getenv('SLACK_USER_TOKEN')
     if not bot_token or not user_token:
         logging.error("SLACK_TOKEN or SLACK_USER_TOKEN environment variable not set.")
+        gmail_manager.close()
         return
 
+    try:
+        run_menu(gmail_manager, bot_token, user_token)
+    finally:
+        # Send replies and read markers still queued in the outbox before exiting
+        gmail_manager.close()
+
+def run_menu(gmail_manager, bot_token, user_token):
     # Display main menu for user interaction
     while True:
         print("\n===== AI_Communication_Assistant =====")
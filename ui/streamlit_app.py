@@ -1,3 +1,4 @@
+import atexit
 import streamlit as st
 from gmail_module.gmail_functions import GmailPriorityManager
 from slack_module.slack_functions import SlackManager
@@ -6,8 +7,18 @@ import logging
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+
+@st.cache_resource
+def get_gmail_manager():
+    """Create the Gmail manager once per server process; Streamlit reruns this script on every interaction."""
+    manager = GmailPriorityManager()
+    # Send what the outbox still holds and close the local stores when the server exits
+    atexit.register(manager.close)
+    return manager
+
+
 # Initialize managers
-gmail_manager = GmailPriorityManager()
+gmail_manager = get_gmail_manager()
 slack_manager = SlackManager()
 
 st.title('AI Communication Assistant')
@@ -51,7 +62,7 @@ if app_mode == "Gmail":
                     if response_text.strip():
                         try:
                             gmail_manager.send_quick_response(email_data, response_text)
-                            st.success("Response sent successfully!")
+                            st.success("Response queued for sending.")
                         except Exception as e:
                             st.error(f"Error sending response: {str(e)}")
                     else: